@@ -2,22 +2,31 @@
 
 
 import os
+import re
 import cv2
 import sys
+import mmap
 import json
 import time
 import numpy
+import errno
 import socket
+import select
 import getopt
+import struct
+import ctypes
+import shutil
+import sqlite3
 import logging
+import platform
+import urlparse
 import datetime
-import StringIO
 import threading
 import traceback
 import subprocess
-from PIL import Image
+import collections
+import multiprocessing
 from SocketServer import ThreadingMixIn, BaseRequestHandler, TCPServer
-from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
 try:
 	from picamera import PiCamera
 	from picamera.array import PiRGBArray
@@ -69,6 +78,10 @@ class Camera(threading.Thread):
 		# Initialize class private variables
 		self._exec = False
 		self._lock = False
+		# Measured frame rate of the surveillance workflow
+		self._fps = None
+		self.__fpsnum = 0
+		self.__fpsclk = None
 		# Initialize camera services
 		self._camera = None
 		self._motion = MotionService(self)
@@ -249,6 +262,8 @@ class Camera(threading.Thread):
 					# Release the captured frame
 					del frame
 					frame = None
+					# Measure the frame rate of the workflow
+					self.__measure()
 				# Sleep for couple of seconds or milliseconds
 				if self._sleeptime > 0:
 					time.sleep(self._sleeptime)
@@ -256,6 +271,21 @@ class Camera(threading.Thread):
 				self.log(["Camera workflow failed:", baserr])
 				self.stop()
 
+	# Method: __measure
+	def __measure(self):
+		self.__fpsnum += 1
+		if self.__fpsclk is None:
+			self.__fpsclk = time.time()
+			self.__fpsnum = 0
+		elif time.time() - self.__fpsclk >= 10:
+			self._fps = round(self.__fpsnum / (time.time() - self.__fpsclk), 2)
+			self.__fpsclk = time.time()
+			self.__fpsnum = 0
+
+	# Method: getCameraFps
+	def getCameraFps(self):
+		return self._fps
+
 	# Method: log
 	def log(self, data, type=None):
 		level, message = tomsg(data, level=type, logger=self._logger)
@@ -425,6 +455,18 @@ class Camera(threading.Thread):
 	def getMotionLastTimestamp(self):
 		return self._motion.getLastTimestamp()
 
+	# Method: getMotionGrayFrame
+	def getMotionGrayFrame(self, blurred=True):
+		return self._motion.getGrayFrame(blurred)
+
+	# Method: getMotionArea
+	def getMotionArea(self):
+		return self._motion.getArea()
+
+	# Method: getMotionBoxes
+	def getMotionBoxes(self):
+		return self._motion.getBoxes()
+
 	# Method: isRecordingEnabled
 	def isCameraRecordingOn(self):
 		return self._record.isRunning()
@@ -476,8 +518,8 @@ class Camera(threading.Thread):
 	# Method: setRecordingFormat
 	def setRecordingFormat(self, value):
 		if self.isCameraRecordingOn():
-			self._record.calibrate(init=True)
 			self._record.setFormat(value)
+			self._record.calibrate(init=True)
 		else:
 			self._record.setFormat(value)
 
@@ -488,8 +530,8 @@ class Camera(threading.Thread):
 	# Method: setRecordingEncoder
 	def setRecordingEncoder(self, value):
 		if self.isCameraRecordingOn():
-			self._record.calibrate(init=True)
 			self._record.setEncoder(value)
+			self._record.calibrate(init=True)
 		else:
 			self._record.setEncoder(value)
 
@@ -497,6 +539,118 @@ class Camera(threading.Thread):
 	def getRecordingEncoder(self):
 		return self._record.getEncoder()
 
+	# Method: getRecordingFourcc
+	def getRecordingFourcc(self):
+		return self._record.getFourcc()
+
+	# Method: setRecordingBudget
+	def setRecordingBudget(self, value):
+		if self.isCameraRecordingOn() and self.getRecordingEncoder() == 'auto':
+			self._record.setBudget(value)
+			self._record.calibrate(init=True)
+		else:
+			self._record.setBudget(value)
+
+	# Method: getRecordingBudget
+	def getRecordingBudget(self):
+		return self._record.getBudget()
+
+	# Method: setRecordingDistance
+	def setRecordingDistance(self, value):
+		self._record.setDistance(value)
+
+	# Method: getRecordingDistance
+	def getRecordingDistance(self):
+		return self._record.getDistance()
+
+	# Method: setRecordingSnapshots
+	def setRecordingSnapshots(self, value):
+		self._record.setSnapshots(value)
+
+	# Method: getRecordingSnapshots
+	def getRecordingSnapshots(self):
+		return self._record.getSnapshots()
+
+	# Method: setRecordingKeyframe
+	def setRecordingKeyframe(self, value):
+		self._record.setKeyframe(value)
+
+	# Method: getRecordingKeyframe
+	def getRecordingKeyframe(self):
+		return self._record.getKeyframe()
+
+	# Method: setRecordingTimelapse
+	def setRecordingTimelapse(self, value):
+		self._record.setTimelapse(value)
+
+	# Method: getRecordingTimelapse
+	def getRecordingTimelapse(self):
+		return self._record.getTimelapse()
+
+	# Method: setRecordingIdletime
+	def setRecordingIdletime(self, value):
+		self._record.setIdletime(value)
+
+	# Method: getRecordingIdletime
+	def getRecordingIdletime(self):
+		return self._record.getIdletime()
+
+	# Method: getRecordingSavedSize
+	def getRecordingSavedSize(self):
+		return self._record.getSavedSize()
+
+	# Method: setRecordingQuota
+	def setRecordingQuota(self, value):
+		self._record.setQuota(value)
+
+	# Method: getRecordingQuota
+	def getRecordingQuota(self):
+		return self._record.getQuota()
+
+	# Method: setRecordingArchive
+	def setRecordingArchive(self, value):
+		self._record.setArchive(value)
+
+	# Method: getRecordingArchive
+	def getRecordingArchive(self):
+		return self._record.getArchive()
+
+	# Method: releaseRecordingSpace
+	def releaseRecordingSpace(self, value):
+		return self._record.release(value)
+
+	# Method: setRecordingAging
+	def setRecordingAging(self, value):
+		self._record.setAging(value)
+
+	# Method: getRecordingAging
+	def getRecordingAging(self):
+		return self._record.getAging()
+
+	# Method: setRecordingStage
+	def setRecordingStage(self, value):
+		self._record.setStage(value)
+
+	# Method: getRecordingStage
+	def getRecordingStage(self):
+		return self._record.getStage()
+
+	# Method: setRecordingStageSize
+	def setRecordingStageSize(self, value):
+		self._record.setStageSize(value)
+
+	# Method: getRecordingStageSize
+	def getRecordingStageSize(self):
+		return self._record.getStageSize()
+
+	# Method: getRecordingStageThroughput
+	def getRecordingStageThroughput(self):
+		return self._record.getStageThroughput()
+
+	# Method: getRecordingStageLag
+	def getRecordingStageLag(self):
+		return self._record.getStageLag()
+
 	# Method: setRecordingMessage
 	def setRecordingMessage(self, value):
 		self._record.setMessage(value)
@@ -517,6 +671,10 @@ class Camera(threading.Thread):
 	def getRecordingLastTimestamp(self):
 		return self._record.getLastTimestamp()
 
+	# Method: setRecordingLastTimestamp
+	def setRecordingLastTimestamp(self, value):
+		self._record.setLastTimestamp(value)
+
 	# Method: isCameraStreamingOn
 	def isCameraStreamingOn(self):
 		return self._stream.isRunning()
@@ -553,6 +711,10 @@ class Camera(threading.Thread):
 	def getStreamingSleep(self):
 		return self._stream.getStreamingSleep()
 
+	# Method: getStreamingClients
+	def getStreamingClients(self):
+		return self._stream.getStreamingClients()
+
 	# Method: setFrameText
 	def setFrameLabel(self, frame, text):
 		if frame is not None and text is not None:
@@ -611,6 +773,9 @@ class MotionService(CamService):
 		self._sympathy = 25
 		# Initialize engine parameters
 		self.__gray = None
+		self.__sharp = None
+		self.__area = 0
+		self.__boxes = []
 		self.__dtmot = None
 		self.__ismot = False
 
@@ -646,6 +811,20 @@ class MotionService(CamService):
 	def getLastTimestamp(self):
 		return self.__dtmot
 
+	# Method: getGrayFrame
+	def getGrayFrame(self, blurred=True):
+		return self.__gray if blurred else self.__sharp
+
+	# Method: getArea
+	def getArea(self):
+		# Area of the motion contours detected in the last frame (for 320x240 resolution)
+		return self.__area
+
+	# Method: getBoxes
+	def getBoxes(self):
+		# Bounding boxes (x1, y1, x2, y2) of the motion contours detected in the last frame, in frame coordinates
+		return self.__boxes
+
 	# Method: run
 	def run(self, frame):
 		# Validate input frame
@@ -654,6 +833,7 @@ class MotionService(CamService):
 		# Resize the frame, convert it to grayscale, and blur it
 		gray = cv2.resize(frame, (320,240))
 		gray = cv2.cvtColor(gray, cv2.COLOR_BGR2GRAY)
+		self.__sharp = gray
 		gray = cv2.GaussianBlur(gray, (21, 21), 0)
 		# If the first frame is None, initialize it
 		if self.__gray is None:
@@ -671,32 +851,47 @@ class MotionService(CamService):
 		# Check contour(s) and identify motion
 		if contours is None or not contours:
 			self.__ismot = False
+			self.__area = 0
+			self.__boxes = []
 		else:
 			motion = False
+			area = 0
+			boxes = []
+			width = numpy.size(frame, 1)
+			height = numpy.size(frame, 0)
 			for contour in contours:
-				snapshot = cv2.contourArea(contour) >= self.getThreshold()
+				size = cv2.contourArea(contour)
+				snapshot = size >= self.getThreshold()
 				motion |= snapshot
 				if snapshot:
+					area += size
 					# Record motion date/time
 					self.__dtmot = datetime.datetime.now()
 					# Compute the bounding box for the contour, draw it on the frame, and update the text
+					(x, y, w, h) = cv2.boundingRect(contour)
+					boxes.append((x * width / 320, y * height / 240, ((x + w) * width + 319) / 320, ((y + h) * height + 239) / 240))
 					if self._contour:
-						(x, y, w, h) = cv2.boundingRect(contour)
-						xr = numpy.size(frame, 1) / 320
-						yr = numpy.size(frame, 0) / 240
+						xr = width / 320
+						yr = height / 240
 						cv2.rectangle(frame, (xr * x, yr * y), (xr * (x + w), yr * (y + h)), (0, 255, 0), 1)
-					else:
-						break
 			self.__ismot = motion
+			self.__area = area
+			self.__boxes = boxes
 
 
 # Class: RecordingService
 class RecordingService(CamService):
+	# Constants
+	SnapshotWindow = 60
+
 	# Constructor
 	def __init__(self, camera, start=False):
 		CamService.__init__(self, camera, start=start)
 		self._format = 'image'
 		self._encoder = 'MP42'
+		# Video encoder used by the recording (selected by the benchmark when the encoder is 'auto') and selection budget
+		self._fourcc = 'MP42'
+		self._budget = '20ms'
 		self._location = '/tmp'
 		# Pause flag to temporary stop the recording workflow
 		self._pause = False
@@ -704,9 +899,37 @@ class RecordingService(CamService):
 		self.__clbr = False
 		# Recording message
 		self.__text = None
-		# Recording references: file name and file handler
+		# Recording references: file name, file handler (video or frame log) and size of the last written frame (bytes)
 		self.__oref = None
 		self.__fref = None
+		self.__wsize = 0
+		# Metadata of the segment being written (stored in the recordings catalog when it is completed)
+		self.__segment = None
+		# Timelapse: number of frames averaged in one image, running sum (float32) of the frames and number of summed frames
+		self._timelapse = 10
+		self.__accum = None
+		self.__accnum = 0
+		# Snapshots: number of best images kept for each motion event (0 means all images are recorded), best frames and event start
+		self._snapshots = 0
+		self.__best = []
+		self.__event = None
+		# Region of interest: period (seconds) of full keyframes, timestamp and size of the last keyframe and the previous motion boxes
+		self._keyframe = 10
+		self.__keyts = None
+		self.__keysize = None
+		self.__boxes = []
+		# Recording files planner: output paths and directories layout
+		self._planner = RecordingPlanner(camera.id, self._location)
+		# Encoder benchmark: encoding cost and size of the available video encoders
+		self._benchmark = EncoderBenchmark(camera, self._planner)
+		# Retention manager: quota and disk space enforcement over recorded files
+		self._retention = RetentionManager(camera, self._planner)
+		# Aging manager: lower quality re-encoding of old recorded files
+		self._aging = AgingManager(camera, self._retention)
+		# Staging area: RAM directory where the recordings are written before they are flushed to recording location
+		self._stage = StagingArea(camera, self._planner, self._retention)
+		# Previews builder: thumbnails of the recorded segments and hourly strips
+		self._previews = PreviewBuilder(camera, self._retention)
 		# Recording frequency (image or video)
 		self._recfq = 2
 		# Recording frame size (image or video)
@@ -717,24 +940,48 @@ class RecordingService(CamService):
 		self._nofrm = 0
 		# Last recording datetime
 		self._dtrec = None
+		# Recording period (seconds) of the idle frames when the recording is driven by motion detection, 0 means no idle recording
+		self._idletime = 0
+		# Duplicates suppression: minimum signature distance, last stored signature and saved size (KB) per day
+		self._distance = 0
+		self.__sign = None
+		self.__dupday = None
+		self._dupsize = 0
+		# Calibration profiles (persisted across restarts) and refresh measurement of a stale profile
+		self._profiles = ProfileCache.instance("calibration.json")
+		self.__rfsh = None
 
 	# Method: start
 	def start(self):
+		# Queue the files left in staging area
+		self._stage.recover()
 		# Run calibration
 		self.calibrate(init=True)
 		# Activate service
 		CamService.start(self)
+		# Start retention and aging managers, staging area flusher and previews builder
+		self._retention.start()
+		self._aging.start()
+		self._stage.start()
+		self._previews.start()
 
 	# Method: stop
 	def stop(self):
-		# Reset video reference
-		if self.__oref is not None:
-			del self.__oref
-			self.__oref = None
+		# Write the pending snapshots and reset video and frame log references
+		if self.__best:
+			self._flushsnapshots()
+		self._closevideo()
+		self._closelog()
 		# Reset file reference
 		self.__fref = None
 		# Deactivate service
 		CamService.stop(self)
+		# Drain staging area and stop retention and aging managers and previews builder
+		self._stage.drain()
+		self._stage.stop()
+		self._retention.stop()
+		self._aging.stop()
+		self._previews.stop()
 
 	# Method: getFormat
 	def getFormat(self):
@@ -747,6 +994,12 @@ class RecordingService(CamService):
 				self._format = 'image'
 			elif format.lower() in ("video", "movie", "v", "m"):
 				self._format = 'video'
+			elif format.lower() in ("framelog", "log", "container", "f", "l"):
+				self._format = 'framelog'
+			elif format.lower() in ("timelapse", "lapse", "t"):
+				self._format = 'timelapse'
+			elif format.lower() in ("roi", "crop", "r"):
+				self._format = 'roi'
 
 	# Method: getEncoder
 	def getEncoder(self):
@@ -754,7 +1007,28 @@ class RecordingService(CamService):
 
 	# Method: setEncoder
 	def setEncoder(self, encoder):
-		self._encoder = encoder
+		if encoder is not None and str(encoder).lower() == 'auto':
+			self._encoder = 'auto'
+		else:
+			self._encoder = encoder
+			self._fourcc = encoder
+
+	# Method: getFourcc
+	def getFourcc(self):
+		return self._fourcc
+
+	# Method: getBudget
+	def getBudget(self):
+		return self._budget
+
+	# Method: setBudget
+	def setBudget(self, budget):
+		if budget is None or str(budget).strip() == '' or str(budget).strip().lower() == 'default':
+			self._budget = '20ms'
+		elif EncoderBenchmark.parse(budget) is not None:
+			self._budget = str(budget).strip().lower().replace(' ', '')
+		else:
+			raise ValueError("Invalid encoder budget (e.g. 20ms or 50kb): " + str(budget))
 
 	# Method: getLocation
 	def getLocation(self):
@@ -763,6 +1037,111 @@ class RecordingService(CamService):
 	# Method: setLocation
 	def setLocation(self, location):
 		self._location = location
+		self._retention.setLocation(location)
+		self._stage.setTarget(location)
+		if not self._stage.isEnabled():
+			self._planner.setLocation(location)
+
+	# Method: getStage
+	def getStage(self):
+		return self._stage.getLocation()
+
+	# Method: setStage
+	def setStage(self, stage):
+		# Complete the current files and flush the staging area before switching the layout
+		self.setNewFile()
+		self._stage.drain()
+		self._stage.setLocation(stage)
+		self._planner.setLocation(self._stage.getLocation() if self._stage.isEnabled() else self._location)
+
+	# Method: getStageSize
+	def getStageSize(self):
+		return self._stage.getBound()
+
+	# Method: setStageSize
+	def setStageSize(self, size):
+		self._stage.setBound(size)
+
+	# Method: getStageThroughput
+	def getStageThroughput(self):
+		return self._stage.getThroughput()
+
+	# Method: getStageLag
+	def getStageLag(self):
+		return self._stage.getLag()
+
+	# Method: getDistance
+	def getDistance(self):
+		return self._distance
+
+	# Method: setDistance
+	def setDistance(self, distance):
+		self._distance = distance
+		self.__sign = None
+
+	# Method: getSnapshots
+	def getSnapshots(self):
+		return self._snapshots
+
+	# Method: setSnapshots
+	def setSnapshots(self, snapshots):
+		self._snapshots = max(0, snapshots)
+
+	# Method: getTimelapse
+	def getTimelapse(self):
+		return self._timelapse
+
+	# Method: setTimelapse
+	def setTimelapse(self, timelapse):
+		self._timelapse = max(1, timelapse)
+
+	# Method: getKeyframe
+	def getKeyframe(self):
+		return self._keyframe
+
+	# Method: setKeyframe
+	def setKeyframe(self, keyframe):
+		self._keyframe = max(1, keyframe)
+
+	# Method: getIdletime
+	def getIdletime(self):
+		return self._idletime
+
+	# Method: setIdletime
+	def setIdletime(self, idletime):
+		self._idletime = idletime
+
+	# Method: getSavedSize
+	def getSavedSize(self):
+		return self._dupsize
+
+	# Method: getQuota
+	def getQuota(self):
+		return self._retention.getQuota()
+
+	# Method: setQuota
+	def setQuota(self, quota):
+		self._retention.setQuota(quota)
+
+	# Method: getArchive
+	def getArchive(self):
+		return self._retention.getArchive()
+
+	# Method: setArchive
+	def setArchive(self, archive):
+		self._retention.setArchive(archive)
+
+	# Method: release
+	def release(self, size):
+		return self._retention.release(size)
+
+	# Method: getAging
+	def getAging(self):
+		return self._aging.getThresholds()
+
+	# Method: setAging
+	def setAging(self, thresholds):
+		self._aging.setThresholds(thresholds)
 
 	# Method: setMessage
 	def setMessage(self, text):
@@ -770,6 +1149,19 @@ class RecordingService(CamService):
 
 	# Method: setPaused
 	def setPause(self, pause):
+		# Paused periods are left out of the profile refresh measurement, so the refresh goes on after the pause (it is
+		# restarted only by a new calibration, when the recording format or encoder is changed)
+		if self.__rfsh is not None and self.__rfsh["start"] is not None:
+			if pause and not self._pause:
+				self.__rfsh["paused"] = datetime.datetime.now()
+			elif not pause and self._pause and self.__rfsh.get("paused") is not None:
+				self.__rfsh["start"] += datetime.datetime.now() - self.__rfsh.pop("paused")
+		# The motion event is over, so write its best frames
+		if pause and not self._pause and self.__best:
+			try:
+				self._flushsnapshots()
+			except BaseException as baserr:
+				self._camera.log(["Error writing recording snapshots:", baserr])
 		self._pause = pause
 
 	# Method: isPaused
@@ -791,10 +1183,86 @@ class RecordingService(CamService):
 	# Method: getFrequency
 	def setNewFile(self):
 		if not self.isCalibrating():
+			self._closevideo()
+			self._closelog()
 			self.__fref = None
-			if self.__oref is not None:
-				del self.__oref
-				self.__oref = None
+
+	# Method: _closevideo
+	def _closevideo(self):
+		# Close the current video file and, if it is a recording, mark it as completed
+		if self.__oref is not None and not isinstance(self.__oref, FrameLog):
+			self.__oref.release()
+			del self.__oref
+			self.__oref = None
+			if self.__fref is not None and not self.isCalibrating() and os.path.isfile(self.__fref):
+				self._complete(self.__fref, os.path.getsize(self.__fref), self._segment(os.path.getsize(self.__fref)))
+
+	# Method: _closelog
+	def _closelog(self):
+		# Close the current frame log and, if it is a recording, mark its files as completed
+		if isinstance(self.__oref, FrameLog):
+			self.__oref.close()
+			if not self.isCalibrating():
+				segment = self._segment(self.__oref.getDataSize() - self.__segment["offset"]) if self.__segment is not None else None
+				self._thumbnail(self.__oref.getDataPath(), segment)
+				if self._stage.isEnabled():
+					self._stage.add(self.__oref.getPath(), self.__oref.getDataSize() + self.__oref.getIndexSize(), self.__oref.__class__, segment)
+				else:
+					self._retention.extend(self.__oref.getDataPath(), self.__oref.getDataSize(), segment)
+					self._retention.extend(self.__oref.getIndexPath(), self.__oref.getIndexSize())
+			self.__oref = None
+
+	# Method: _complete
+	def _complete(self, path, size, segment=None):
+		self._thumbnail(path, segment)
+		if self._stage.isEnabled():
+			self._stage.add(path, size, segment=segment)
+		else:
+			self._retention.register(path, size, segment)
+
+	# Method: _thumbnail
+	def _thumbnail(self, path, segment):
+		# The thumbnail is built next to the recording (after the staging area is flushed)
+		if segment is not None and segment.get("thumbnail") is not None:
+			self._previews.addThumbnail(self._stage.getTargetPath(path) if self._stage.isEnabled() else path, segment.pop("thumbnail"))
+
+	# Method: _track
+	def _track(self, new=False, offset=0, frame=None):
+		# Update the metadata of the segment being written with the last recorded frame
+		if self.isCalibrating():
+			return
+		now = time.time()
+		if new or self.__segment is None:
+			self.__segment = {"start":now, "end":now, "frames":0, "size":0, "offset":offset, "format":self._format, "motion":False}
+			# The first frame of a video or frame log segment is kept (downscaled) for its thumbnail
+			if frame is not None:
+				self.__segment["thumbnail"] = PreviewBuilder.shrink(frame)
+		self.__segment["end"] = now
+		self.__segment["frames"] += 1
+		if not self.__segment["motion"] and self._camera.isCameraMotionOn():
+			self.__segment["motion"] = self._camera.isMotionDetected()
+
+	# Method: _segment
+	def _segment(self, size):
+		# Close the tracked segment and return its metadata
+		segment = self.__segment
+		self.__segment = None
+		if segment is not None:
+			segment["size"] = size
+		return segment
+
+	# Method: _getStripPath
+	def _getStripPath(self):
+		# Hourly strip is stored in the day folder of recording location
+		return self._location + time.strftime("/%Y%m/%d/", time.localtime()) + self._planner.getName() + time.strftime("-%Y%m%d-%H", time.localtime()) + PreviewBuilder.Strip
+
+	# Method: _writefile
+	def _writefile(self, path, data):
+		file = open(path, 'wb')
+		try:
+			file.write(data)
+		finally:
+			file.close()
 
 	# Method: _writevideo
 	def _writevideo(self, frame):
@@ -806,71 +1274,218 @@ class RecordingService(CamService):
 			self.__oref = None
 		if frefExists or orefExists or frefInvalid:
 			if self.isCalibrating():
-				self.__fref = self._location
-				if not os.path.exists(self.__fref):
-					os.makedirs(self.__fref)
-				self.__fref += "/cam" + str(self._camera.id).rjust(2, '0') + "-calibration-sample.avi"
+				self.__fref = self._planner.getSamplePath(".avi")
 			else:
-				self.__fref = self._location + time.strftime("/%Y%m/%d/", time.localtime())
-				if not os.path.exists(self.__fref):
-					os.makedirs(self.__fref)
-				self.__fref += os.path.sep + "cam" + str(self._camera.id).rjust(2, '0')
-				self.__fref += "-" + datetime.datetime.now().strftime("%Y%m%d-%H%M%S") + ".avi"
-			encoder = cv2.VideoWriter_fourcc(*self._encoder)
+				self.__fref = self._planner.getVideoPath()
+			encoder = cv2.VideoWriter_fourcc(*self._fourcc)
 			resolut = (numpy.size(frame, 1), numpy.size(frame, 0))
 			self.__oref = cv2.VideoWriter(self.__fref, encoder, self._recfq, resolut, True)
+			# A video encoder missing from OpenCV build would write nothing without any error
+			if not self.__oref.isOpened():
+				raise RuntimeError("Video encoder " + str(self._fourcc) + " is not available")
 		self._dtrec = datetime.datetime.now()
 		self.__oref.write(frame)
 		self._nofrm += 1
+		self._track(frefExists or orefExists or frefInvalid, frame=frame)
+		# Split the video written into staging area, so it can be flushed before the staging area is full
+		if self._stage.isEnabled() and not self.isCalibrating() and self._nofrm % 100 == 0 and os.path.getsize(self.__fref) > self._stage.getPartSize():
+			self.setNewFile()
 
 	# Method: _writeimage
 	def _writeimage(self, frame):
-		# Set the file name
-		if self.__fref is None:
-			if self.isCalibrating():
-				self.__fref = self._location
-				if not os.path.exists(self.__fref):
-					os.makedirs(self.__fref)
-				self.__fref += "/cam" + str(self._camera.id).rjust(2, '0') +  "-calibration-sample.png"
-			else:
-				self.__fref = self._location + time.strftime("/%Y%m/%d/%H", time.localtime())
-				if not os.path.exists(self.__fref):
-					os.makedirs(self.__fref)
-				self.__fref += os.path.sep + "cam" + str(self._camera.id).rjust(2, '0')
-				self.__fref += "-" + datetime.datetime.now().strftime("%Y%m%d-%H%M%S-%f")
-				self.__fref += ".png"
 		self._dtrec = datetime.datetime.now()
-		cv2.imwrite(self.__fref, frame)
+		self.__wsize = self._saveimage(frame)
+		self._nofrm += 1
+
+	# Method: _saveimage
+	def _saveimage(self, frame, timestamp=None):
+		# Set the file name: calibration uses one sample file, recording one file per image
+		if self.isCalibrating():
+			if self.__fref is None:
+				self.__fref = self._planner.getSamplePath(".png")
+		else:
+			self.__fref = self._planner.getImagePath(now=timestamp)
+		data = cv2.imencode(".png", frame)[1].tostring()
+		try:
+			self._writefile(self.__fref, data)
+		except IOError:
+			# The directory might have been removed in the meantime, so check the layout again
+			self._planner.forget()
+			self.__fref = self._planner.getSamplePath(".png") if self.isCalibrating() else self._planner.getImagePath(now=timestamp)
+			self._writefile(self.__fref, data)
+		if not self.isCalibrating():
+			self._track(True)
+			if timestamp is not None:
+				self.__segment["start"] = self.__segment["end"] = timestamp
+			self._complete(self.__fref, len(data), self._segment(len(data)))
+		return len(data)
+
+	# Method: _writesnapshot
+	def _writesnapshot(self, frame):
+		# Keep the best frames of a motion event: sharpness (Laplacian variance of the unblurred gray frame) by motion area
+		now = time.time()
+		if self.__event is None:
+			self.__event = now
+		gray = self._camera.getMotionGrayFrame(False) if self._camera.isCameraMotionOn() else None
+		if gray is None:
+			gray = cv2.cvtColor(cv2.resize(frame, (320, 240), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+		area = self._camera.getMotionArea() if self._camera.isCameraMotionOn() else 0
+		score = cv2.Laplacian(gray, cv2.CV_64F).var() * max(1, area)
+		self._dtrec = datetime.datetime.now()
+		self.__wsize = 0
+		if len(self.__best) < self._snapshots:
+			self.__best.append((score, now, frame.copy()))
+		else:
+			worst = min(range(len(self.__best)), key=lambda index: self.__best[index][0])
+			if score > self.__best[worst][0]:
+				self.__best[worst] = (score, now, frame.copy())
+		# Long events (or recording without motion detection) are split in windows
+		if now - self.__event >= RecordingService.SnapshotWindow:
+			self._flushsnapshots()
+
+	# Method: _flushsnapshots
+	def _flushsnapshots(self):
+		# Write the best frames of the event in chronological order
+		best = sorted(self.__best, key=lambda item: item[1])
+		self.__best = []
+		self.__event = None
+		self.__wsize = 0
+		for score, timestamp, frame in best:
+			self.__wsize += self._saveimage(frame, timestamp)
+			self._nofrm += 1
+
+	# Method: _writetimelapse
+	def _writetimelapse(self, frame):
+		# Sum the frames in place (float32) and write their mean as one image for each RecordingTimelapse frames
+		if self.__accum is None or self.__accum.shape != frame.shape:
+			self.__accum = numpy.zeros(frame.shape, numpy.float32)
+			self.__accnum = 0
+		cv2.accumulate(frame, self.__accum)
+		self.__accnum += 1
+		self._dtrec = datetime.datetime.now()
+		self._nofrm += 1
+		self.__wsize = 0
+		# Calibration writes the current mean for each frame to measure the size of the averaged images
+		if self.__accnum >= self._timelapse or self.isCalibrating():
+			mean = cv2.convertScaleAbs(self.__accum, alpha=1.0 / self.__accnum)
+			self._camera.setFrameLabel(mean, self.__text)
+			# The written size is spread over the averaged frames
+			self.__wsize = self._saveimage(mean) / self._timelapse
+			if not self.isCalibrating():
+				self.__accum.fill(0)
+				self.__accnum = 0
+
+	# Method: _writelog
+	def _writelog(self, frame):
+		# One frame log per hour: a new one is opened when the hour rolls over
+		path = self._planner.getSamplePath("") if self.isCalibrating() else self._planner.getLogPath()
+		new = self.__oref.__class__ is not FrameLog or self.__oref.getPath() != path
+		if new:
+			self._closelog()
+			self.__oref = FrameLog(path)
+			self.__fref = self.__oref.getDataPath()
+		offset = self.__oref.getDataSize()
+		self._dtrec = datetime.datetime.now()
+		self.__wsize = self.__oref.append(time.time(), cv2.imencode(FrameLog.Encoding, frame)[1].tostring())
+		self._nofrm += 1
+		self._track(new, offset, frame)
+		# Close the part written into staging area, so it can be flushed before the staging area is full
+		if self._stage.isEnabled() and not self.isCalibrating() and self.__oref.getDataSize() > self._stage.getPartSize():
+			self._closelog()
+
+	# Method: _writeroi
+	def _writeroi(self, frame):
+		# Full keyframe periodically, otherwise only the crop around current and previous motion boxes (the previous ones refresh the vacated area)
+		path = self._planner.getSamplePath("") if self.isCalibrating() else self._planner.getLogPath()
+		new = self.__oref.__class__ is not RoiLog or self.__oref.getPath() != path
+		if new:
+			self._closelog()
+			self.__oref = RoiLog(path)
+			self.__fref = self.__oref.getDataPath()
+		offset = self.__oref.getDataSize()
+		now = time.time()
+		height, width = frame.shape[:2]
+		boxes = self._camera.getMotionBoxes() if self._camera.isCameraMotionOn() else []
+		self.__wsize = 0
+		if new or self.__keyts is None or now - self.__keyts >= self._keyframe or self.__keysize != (width, height):
+			self.__wsize = self.__oref.append(now, cv2.imencode(FrameLog.Encoding, frame)[1].tostring(), RoiLog.Keyframe, 0, 0, width, height)
+			self.__keyts = now
+			self.__keysize = (width, height)
+		elif boxes or self.__boxes:
+			x1 = max(0, min([box[0] for box in boxes + self.__boxes]) - 8)
+			y1 = max(0, min([box[1] for box in boxes + self.__boxes]) - 8)
+			x2 = min(width, max([box[2] for box in boxes + self.__boxes]) + 8)
+			y2 = min(height, max([box[3] for box in boxes + self.__boxes]) + 8)
+			if x2 > x1 and y2 > y1:
+				self.__wsize = self.__oref.append(now, cv2.imencode(FrameLog.Encoding, frame[y1:y2, x1:x2])[1].tostring(), RoiLog.Crop, x1, y1, x2 - x1, y2 - y1)
+		self.__boxes = boxes
 		self._nofrm += 1
+		if self.__wsize > 0:
+			self._dtrec = datetime.datetime.now()
+			self._track(new, offset, frame)
+		# Close the part written into staging area, so it can be flushed before the staging area is full
+		if self._stage.isEnabled() and not self.isCalibrating() and self.__oref.getDataSize() > self._stage.getPartSize():
+			self._closelog()
 
 	# Method: getLastTimestamp
 	def getLastTimestamp(self):
 		return self._dtrec
 
+	# Method: setLastTimestamp
+	def setLastTimestamp(self, timestamp):
+		self._dtrec = timestamp
+
 	# Method: isCalibrating
 	def isCalibrating(self):
 		return self.__clbr
 
+	# Method: _profilekey
+	def _profilekey(self):
+		resolution = self._camera.getCameraResolution()
+		key = "cam" + str(self._camera.id).rjust(2, '0')
+		key += "-" + ("default" if resolution is None else str(resolution[0]) + "x" + str(resolution[1]))
+		key += "-" + str(self._format) + "-" + str(self._fourcc)
+		return key
+
 	# Method: calibrate
 	def calibrate(self, init=False):
 		if init:
+			if self.__best:
+				self._flushsnapshots()
+			self._closevideo()
+			self._closelog()
 			self.__dtclbr = None
 			self.__clbr = init
 			self.__oref = None
 			self.__fref = None
 			self.__nerr = 0
+			self.__rfsh = None
+			self.__accum = None
 			self._recfq = 2
 			self._fsize = 0
 			self._nofrm = 0
 			self._pause = False
 			self.__text = "Calibrating"
+			# Select the video encoder against the budget (the benchmark results are reused from the previous runs)
+			if self._format == 'video' and self._encoder == 'auto':
+				self._fourcc = self._benchmark.select(self._camera.getCameraResolution(), self._budget)
+			# Skip calibration when the same camera setup has been already measured
+			profile = self._profiles.get(self._profilekey())
+			if profile is not None:
+				self._recfq = profile["framerate"]
+				self._fsize = profile["framesize"]
+				self.__text = None
+				self.__clbr = False
+				if self._profiles.isStale(profile):
+					self.__rfsh = {"start":None}
+				self._camera.log("Calibration profile " + self._profilekey() + " has been reused" + (" (it will be refreshed)" if self.__rfsh is not None else "") + ": recording frame rate is " + str(self._recfq) + " f/s and the average frame size is " + str(self._fsize) + " KB")
 		elif self.__clbr:
 			# Set calibration start date/time
 			if self.__dtclbr is None:
 				self.__dtclbr = datetime.datetime.now()
 			# Run measurement of output resources during calibration
-			if self._format == 'image':
-				self._fsize += os.path.getsize(self.__fref) / 1024
+			if self._format in ('image', 'framelog', 'timelapse', 'roi'):
+				self._fsize += self.__wsize / 1024.0
 			elif self._format == 'video':
 				self._fsize = os.path.getsize(self.__fref) / 1024
 			# Run evaluation of output resources after calibration
@@ -878,18 +1493,24 @@ class RecordingService(CamService):
 				# Calculate frequency
 				self._recfq = int(round(self._nofrm / (datetime.datetime.now() - self.__dtclbr).total_seconds(), 0))
 				#  Calculate sample size
-				if self._format == 'image':
+				if self._format in ('image', 'framelog', 'timelapse', 'roi'):
 					self._fsize = round(self._fsize / self._nofrm, 2)
 				elif self._format == 'video':
 					self._fsize = round(self._fsize / (datetime.datetime.now() - self.__dtclbr).total_seconds(), 2)
 					del self.__oref
 					self.__oref = None
-				# Remove sample file
+				# Remove sample file(s)
+				if self._format in ('framelog', 'roi'):
+					index = self.__oref.getIndexPath()
+					self._closelog()
+					os.remove(index)
 				os.remove(self.__fref)
 				self._camera.log("Calibration process detected recording frame rate is " + str(self._recfq) + " f/s and the average frame size is " + str(self._fsize) + " KB")
+				self._profiles.set(self._profilekey(), {"framerate":self._recfq, "framesize":self._fsize})
 				self._nofrm = 0
 				self.__nerr = 0
 				self.__fref = None
+				self.__accum = None
 				self.__text = None
 				self.__clbr = False
 
@@ -903,15 +1524,35 @@ class RecordingService(CamService):
 			self.__text = "Recording"
 		# Recording and calibration workflow
 		try:
-			# Set recording message
-			self._camera.setFrameLabel(frame, self.__text)
+			# Skip the images that are almost the same with the last stored one
+			if self._format in ('image', 'framelog') and not self.isCalibrating() and self._isduplicate(frame):
+				return
+			# Set recording message (timelapse sets it on the averaged image, roi would keep a stale label out of the crops)
+			if self._format not in ('timelapse', 'roi'):
+				self._camera.setFrameLabel(frame, self.__text)
 			# Save/write output file
-			if self._format == 'image':
+			if self._format == 'image' and self._snapshots > 0 and not self.isCalibrating():
+				self._writesnapshot(frame)
+			elif self._format == 'image':
+				if self.__best:
+					self._flushsnapshots()
 				self._writeimage(frame)
 			elif self._format == 'video':
 				self._writevideo(frame)
+			elif self._format == 'framelog':
+				self._writelog(frame)
+			elif self._format == 'timelapse':
+				self._writetimelapse(frame)
+			elif self._format == 'roi':
+				self._writeroi(frame)
+			# Add a tile to the hourly strip (from the frame in memory)
+			if not self.isCalibrating() and self._previews.isTileDue(time.time()):
+				self._previews.addTile(self._getStripPath(), PreviewBuilder.shrink(frame), time.time())
 			# Reset the errors counter detected during recording
 			self.__nerr = 0
+			# Flush the staging area under pressure, the recording waits for it
+			if self._stage.isFull():
+				self._stage.flush()
 		except BaseException as baserr:
 			self.__nerr += 1
 			if self.__nerr >= 5 or self.__clbr:
@@ -919,9 +1560,1425 @@ class RecordingService(CamService):
 				self.stop()
 			else:
 				self._camera.log(["Error in recording workflow:", baserr])
-		# Check calibration process
-		if self.isCalibrating():
+		# Check calibration process (unless the recording has been stopped by the errors)
+		if self.isNotRunning():
+			return
+		elif self.isCalibrating():
 			self.calibrate()
+		elif self.__rfsh is not None:
+			self._refresh()
+
+	# Method: _isduplicate
+	def _isduplicate(self, frame):
+		if self._distance <= 0:
+			return False
+		# Build the mean-hash signature, reusing the motion detection gray frame when it is available
+		gray = self._camera.getMotionGrayFrame() if self._camera.isCameraMotionOn() else None
+		if gray is None:
+			gray = cv2.cvtColor(cv2.resize(frame, (32, 24), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+		small = cv2.resize(gray, (8, 8), interpolation=cv2.INTER_AREA)
+		signature = small > small.mean()
+		if self.__sign is not None and numpy.count_nonzero(signature != self.__sign) < self._distance:
+			today = datetime.date.today()
+			if self.__dupday != today:
+				if self.__dupday is not None:
+					self._camera.log("Duplicates suppression saved " + str(self._dupsize) + " KB on " + str(self.__dupday))
+				self.__dupday = today
+				self._dupsize = 0
+			self._dupsize += self._fsize
+			return True
+		self.__sign = signature
+		return False
+
+	# Method: _refresh
+	def _refresh(self):
+		# Measure the recording workflow (without stopping it) to refresh a stale calibration profile
+		try:
+			if self.__rfsh["start"] is None or (self._format == 'video' and self.__rfsh["file"] != self.__fref):
+				self.__rfsh = {"start":datetime.datetime.now(), "file":self.__fref, "frames":0, "size":0}
+				if self._format == 'video':
+					self.__rfsh["size"] = os.path.getsize(self.__fref) / 1024
+				return
+			self.__rfsh["frames"] += 1
+			if self._format in ('image', 'framelog', 'timelapse', 'roi'):
+				self.__rfsh["size"] += self.__wsize / 1024.0
+			period = (datetime.datetime.now() - self.__rfsh["start"]).total_seconds()
+			if period > 20:
+				self._recfq = int(round(self.__rfsh["frames"] / period, 0))
+				if self._format in ('image', 'framelog', 'timelapse', 'roi'):
+					self._fsize = round(self.__rfsh["size"] / self.__rfsh["frames"], 2)
+				elif self._format == 'video':
+					self._fsize = round((os.path.getsize(self.__fref) / 1024 - self.__rfsh["size"]) / period, 2)
+				self.__rfsh = None
+				self._profiles.set(self._profilekey(), {"framerate":self._recfq, "framesize":self._fsize})
+				self._camera.log("Calibration profile " + self._profilekey() + " has been refreshed: recording frame rate is " + str(self._recfq) + " f/s and the average frame size is " + str(self._fsize) + " KB")
+		except BaseException as baserr:
+			self.__rfsh = None
+			self._camera.log(["Calibration profile refresh failed:", baserr])
+
+
+# Class: EncoderBenchmark
+class EncoderBenchmark:
+	# Constants
+	Encoders = ['MJPG', 'XVID', 'MP42']
+	Frames = 30
+	Resolution = (640, 480)
+
+	# Constructor
+	def __init__(self, camera, planner):
+		self._camera = camera
+		self._planner = planner
+		# Benchmark results for each resolution (persisted across restarts)
+		self._results = ProfileCache.instance("encoders.json")
+
+	# Method: parse
+	@staticmethod
+	def parse(budget):
+		# Budget as maximum encoding time (e.g. 20ms per frame) or maximum size (e.g. 50kb per frame)
+		match = re.match(r"^\s*(\d+(\.\d+)?)\s*(ms|kb)\s*$", str(budget), re.IGNORECASE)
+		if match is None:
+			return None
+		return match.group(3).lower(), float(match.group(1))
+
+	# Method: sample
+	def sample(self, resolution):
+		# Synthetic frames: a gradient with sensor-like noise and a moving object, so the inter-frame encoders have some work
+		width, height = resolution
+		background = numpy.zeros((height, width, 3), numpy.uint8)
+		background[:, :, 0] = numpy.linspace(0, 255, width).astype(numpy.uint8)[numpy.newaxis, :]
+		background[:, :, 1] = numpy.linspace(0, 255, height).astype(numpy.uint8)[:, numpy.newaxis]
+		random = numpy.random.RandomState(0)
+		frames = []
+		for index in range(EncoderBenchmark.Frames):
+			frame = cv2.add(background, random.randint(0, 12, background.shape).astype(numpy.uint8))
+			x = index * width / (2 * EncoderBenchmark.Frames)
+			cv2.rectangle(frame, (x, height / 4), (x + width / 4, height / 2), (255, 255, 255), -1)
+			frames.append(frame)
+		return frames
+
+	# Method: measure
+	def measure(self, encoder, frames):
+		# Encoding time (ms/frame) and size (bytes/frame) of one encoder, None when it is not available
+		path = self._planner.getSamplePath("-" + encoder.lower() + ".avi")
+		resolution = (numpy.size(frames[0], 1), numpy.size(frames[0], 0))
+		writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*encoder), 10, resolution, True)
+		try:
+			if not writer.isOpened():
+				return None
+			start = time.time()
+			for frame in frames:
+				writer.write(frame)
+			writer.release()
+			duration = time.time() - start
+			size = os.path.getsize(path) if os.path.isfile(path) else 0
+			if size == 0:
+				return None
+			return {"ms":round(duration * 1000 / len(frames), 2), "bytes":size / len(frames)}
+		except BaseException as baserr:
+			self._camera.log(["Encoder " + encoder + " benchmark failed:", baserr], "DEBUG")
+			return None
+		finally:
+			writer.release()
+			if os.path.isfile(path):
+				os.remove(path)
+
+	# Method: run
+	def run(self, resolution=None):
+		# Benchmark the encoders for the resolution, the results are measured again when they are stale
+		if resolution is None:
+			resolution = EncoderBenchmark.Resolution
+		key = str(resolution[0]) + "x" + str(resolution[1])
+		profile = self._results.get(key)
+		if not self._results.isStale(profile):
+			return profile["encoders"]
+		frames = self.sample(resolution)
+		results = {}
+		for encoder in EncoderBenchmark.Encoders:
+			results[encoder] = self.measure(encoder, frames)
+		self._results.set(key, {"encoders":results})
+		self._camera.log("Encoders benchmark for " + key + " resolution: " + ", ".join([encoder + " " + (str(results[encoder]["ms"]) + " ms/frame and " + str(round(results[encoder]["bytes"] / 1024.0, 2)) + " KB/frame" if results[encoder] is not None else "is not available") for encoder in EncoderBenchmark.Encoders]))
+		return results
+
+	# Method: select
+	def select(self, resolution, budget):
+		# Smallest output within time budget or fastest encoder within size budget; closest to the budget when none fits it
+		results = self.run(resolution)
+		encoders = [(encoder, results[encoder]) for encoder in EncoderBenchmark.Encoders if results.get(encoder) is not None]
+		if not encoders:
+			self._camera.log("No video encoder passed the benchmark, " + EncoderBenchmark.Encoders[-1] + " is used", "WARN")
+			return EncoderBenchmark.Encoders[-1]
+		kind, limit = EncoderBenchmark.parse(budget)
+		if kind == 'ms':
+			fitting = [item for item in encoders if item[1]["ms"] <= limit]
+			encoder = min(fitting, key=lambda item: item[1]["bytes"]) if fitting else min(encoders, key=lambda item: item[1]["ms"])
+		else:
+			fitting = [item for item in encoders if item[1]["bytes"] <= limit * 1024]
+			encoder = min(fitting, key=lambda item: item[1]["ms"]) if fitting else min(encoders, key=lambda item: item[1]["bytes"])
+		self._camera.log("Video encoder " + encoder[0] + " has been selected for " + budget + " budget (" + str(encoder[1]["ms"]) + " ms/frame and " + str(round(encoder[1]["bytes"] / 1024.0, 2)) + " KB/frame)")
+		return encoder[0]
+
+
+# Class: ProfileCache
+class ProfileCache:
+	# Constants
+	Location = "/var/lib/picam"
+	Lifetime = 7 * 24 * 3600
+	# Shared instances, one per cache file
+	_instances = {}
+	_ilock = threading.Lock()
+
+	# Constructor
+	def __init__(self, name):
+		self._file = os.path.join(ProfileCache.Location, name)
+		self._lock = threading.Lock()
+		self._data = None
+
+	# Method: instance
+	@staticmethod
+	def instance(name):
+		with ProfileCache._ilock:
+			if name not in ProfileCache._instances:
+				ProfileCache._instances[name] = ProfileCache(name)
+			return ProfileCache._instances[name]
+
+	# Method: _load
+	def _load(self):
+		if self._data is None:
+			try:
+				if os.path.isfile(self._file):
+					file = open(self._file, 'r')
+					self._data = json.load(file)
+					file.close()
+			except BaseException:
+				self._data = None
+			if not isinstance(self._data, dict):
+				self._data = {}
+		return self._data
+
+	# Method: get
+	def get(self, key):
+		with self._lock:
+			return self._load().get(key)
+
+	# Method: set
+	def set(self, key, profile):
+		with self._lock:
+			profile["timestamp"] = time.time()
+			self._load()[key] = profile
+			try:
+				if not os.path.exists(os.path.dirname(self._file)):
+					os.makedirs(os.path.dirname(self._file))
+				# Write a temporary file and rename it to never leave a truncated cache behind
+				file = open(self._file + ".tmp", 'w')
+				file.write(json.dumps(self._data, indent=4, sort_keys=True))
+				file.close()
+				os.rename(self._file + ".tmp", self._file)
+			except BaseException as baserr:
+				print "%s | %s %s > %s" % (time.strftime("%y%m%d%H%M%S", time.localtime()), "WARN", "PiCam", tomsg(["Profile cache could not be saved:", baserr])[1])
+
+	# Method: isStale
+	def isStale(self, profile):
+		return profile is None or time.time() - profile.get("timestamp", 0) > ProfileCache.Lifetime
+
+
+# Class: RecordingCatalog
+class RecordingCatalog:
+	# Constants
+	Location = "/var/lib/picam"
+	Sleeptime = 5
+	Limit = 1000
+	# Bound variables of one statement (older SQLite builds allow at most 999) and write attempts of a statement
+	Variables = 900
+	Attempts = 3
+	# Shared instances, one per database file
+	_instances = {}
+	_ilock = threading.Lock()
+
+	# Constructor
+	def __init__(self, name):
+		self._file = os.path.join(RecordingCatalog.Location, name)
+		# Pending statements (and their failed write attempts), executed in batches by the writer thread
+		self._queue = collections.deque()
+		self._lock = threading.Lock()
+		self._wlock = threading.Lock()
+		self._thread = None
+
+	# Method: instance
+	@staticmethod
+	def instance(name="recordings.db"):
+		with RecordingCatalog._ilock:
+			if name not in RecordingCatalog._instances:
+				RecordingCatalog._instances[name] = RecordingCatalog(name)
+			return RecordingCatalog._instances[name]
+
+	# Method: period
+	@staticmethod
+	def period(text):
+		# Parse a time range like 20261019-10..20261019-1130 (date with optional hour, minutes and seconds); an open end is not limited
+		bounds = [None, None]
+		parts = text.split("..") if text is not None and text.strip() != '' else []
+		if len(parts) > 2:
+			raise RuntimeError("Invalid time range: " + any2str(text))
+		if len(parts) == 1:
+			parts = [parts[0], parts[0]]
+		for index in range(len(parts)):
+			value = parts[index].strip().replace("-", "")
+			if value == '':
+				continue
+			if len(value) not in (8, 10, 12, 14) or not value.isdigit():
+				raise RuntimeError("Invalid time value: " + any2str(parts[index]))
+			start = time.mktime(time.strptime(value, "%Y%m%d%H%M%S"[0:len(value) - 2]))
+			# The end is the last second of the specified day, hour, minute or second
+			if index == 1:
+				start += {8:86400, 10:3600, 12:60, 14:1}[len(value)] - 1
+			bounds[index] = start
+		return bounds[0], bounds[1]
+
+	# Method: _connect
+	def _connect(self):
+		if not os.path.isdir(os.path.dirname(self._file)):
+			os.makedirs(os.path.dirname(self._file))
+		connection = sqlite3.connect(self._file, timeout=30)
+		connection.execute("CREATE TABLE IF NOT EXISTS recordings (camera INTEGER, path TEXT, started REAL, ended REAL, frames INTEGER, size INTEGER, format TEXT, motion INTEGER)")
+		connection.execute("CREATE INDEX IF NOT EXISTS recordings_time ON recordings (camera, ended)")
+		connection.execute("CREATE INDEX IF NOT EXISTS recordings_path ON recordings (path)")
+		return connection
+
+	# Method: _submit
+	def _submit(self, statement, parameters):
+		with self._lock:
+			self._queue.append((statement, parameters, 0))
+			if self._thread is None or not self._thread.isAlive():
+				self._thread = threading.Thread(target=self.run)
+				self._thread.daemon = True
+				self._thread.start()
+
+	# Method: add
+	def add(self, camera, path, segment):
+		# Register a completed segment (recording file, frame log part or still image)
+		self._submit("INSERT INTO recordings VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (camera, path, segment["start"], segment["end"], segment["frames"], segment["size"], segment["format"], 1 if segment["motion"] else 0))
+
+	# Method: move
+	def move(self, path, target):
+		self._submit("UPDATE recordings SET path = ? WHERE path = ?", (target, path))
+
+	# Method: remove
+	def remove(self, path):
+		self._submit("DELETE FROM recordings WHERE path = ?", (path,))
+
+	# Method: replace
+	def replace(self, sources, path, size, step=1):
+		# Aggregate the segments of source files into one segment of the file that replaces them (frames are decimated by step);
+		# the sources are aggregated by chunks (bound variables are limited) in partial segments, merged at the end
+		part = path + ".part"
+		for index in range(0, len(sources), RecordingCatalog.Variables):
+			chunk = list(sources[index:index + RecordingCatalog.Variables])
+			marks = ", ".join(["?"] * len(chunk))
+			self._submit("INSERT INTO recordings SELECT camera, ?, MIN(started), MAX(ended), SUM(frames), 0, 'video', MAX(motion) FROM recordings WHERE path IN (" + marks + ") GROUP BY camera", tuple([part] + chunk))
+			self._submit("DELETE FROM recordings WHERE path IN (" + marks + ")", tuple(chunk))
+		self._submit("INSERT INTO recordings SELECT camera, ?, MIN(started), MAX(ended), (SUM(frames) + ? - 1) / ?, ?, 'video', MAX(motion) FROM recordings WHERE path = ? GROUP BY camera", (path, step, step, size, part))
+		self._submit("DELETE FROM recordings WHERE path = ?", (part,))
+
+	# Method: find
+	def find(self, camera=None, start=None, end=None, limit=None):
+		# Segments overlapping the time range, oldest first (pending statements are written first)
+		self._write()
+		query = "SELECT camera, path, started, ended, frames, size, format, motion FROM recordings WHERE 1 = 1"
+		parameters = []
+		if camera is not None:
+			query += " AND camera = ?"
+			parameters.append(camera)
+		if start is not None:
+			query += " AND ended >= ?"
+			parameters.append(start)
+		if end is not None:
+			query += " AND started <= ?"
+			parameters.append(end)
+		query += " ORDER BY started LIMIT ?"
+		parameters.append(limit if limit is not None else RecordingCatalog.Limit)
+		connection = self._connect()
+		try:
+			return connection.execute(query, parameters).fetchall()
+		finally:
+			connection.close()
+
+	# Method: _write
+	def _write(self):
+		with self._wlock:
+			with self._lock:
+				batch = list(self._queue)
+				self._queue.clear()
+			if not batch:
+				return
+			error = None
+			size = len(batch)
+			try:
+				connection = self._connect()
+				try:
+					# One transaction for the whole batch, or one for each statement when the batch fails (so one bad
+					# statement does not drop the others)
+					try:
+						with connection:
+							for statement, parameters, attempts in batch:
+								connection.execute(statement, parameters)
+						batch = []
+					except sqlite3.Error:
+						failed = []
+						for item in batch:
+							try:
+								with connection:
+									connection.execute(item[0], item[1])
+							except sqlite3.Error as sqlerr:
+								failed.append(item)
+								error = sqlerr
+						batch = failed
+				finally:
+					connection.close()
+			finally:
+				# The failed statements are written again with the next batch; when the other statements have been written
+				# (the database works) a statement failing too many times is dropped
+				increment = 1 if len(batch) < size else 0
+				retry = [(statement, parameters, attempts + increment) for statement, parameters, attempts in batch if attempts + increment < RecordingCatalog.Attempts]
+				with self._lock:
+					self._queue.extendleft(reversed(retry))
+				if len(retry) < len(batch):
+					self._warn(["Recordings catalog dropped " + str(len(batch) - len(retry)) + " statement(s):", error])
+			if batch and len(batch) == size and error is not None:
+				self._warn(["Recordings catalog could not be updated:", error])
+
+	# Method: run
+	def run(self):
+		while True:
+			time.sleep(RecordingCatalog.Sleeptime)
+			try:
+				self._write()
+			except BaseException as baserr:
+				self._warn(["Recordings catalog could not be updated:", baserr])
+
+	# Method: _warn
+	def _warn(self, data):
+		print "%s | %s %s > %s" % (time.strftime("%y%m%d%H%M%S", time.localtime()), "WARN", "PiCam", tomsg(data)[1])
+
+
+# Class: RecordingPlanner
+class RecordingPlanner:
+	# Constructor
+	def __init__(self, id, location):
+		self._name = "cam" + str(id).rjust(2, '0')
+		self._location = location
+		# Directories known to exist
+		self._dirs = set()
+		# Layout of the current hour: [start, end) interval, day and hour directories and file name prefix
+		self._hstart = None
+		self._hend = None
+		self._daydir = None
+		self._hourdir = None
+		self._hourname = None
+
+	# Method: getLocation
+	def getLocation(self):
+		return self._location
+
+	# Method: setLocation
+	def setLocation(self, location):
+		self._location = location
+		self._hstart = None
+		self.forget()
+
+	# Method: forget
+	def forget(self, path=None):
+		# Drop cached directories (all or only the ones under a specific path) that are no longer reliable
+		if path is None:
+			self._dirs.clear()
+		else:
+			for dirpath in list(self._dirs):
+				if dirpath == path or dirpath.startswith(path + os.path.sep):
+					self._dirs.discard(dirpath)
+
+	# Method: _ensure
+	def _ensure(self, path):
+		if path not in self._dirs:
+			if not os.path.isdir(path):
+				os.makedirs(path)
+			self._dirs.add(path)
+		return path
+
+	# Method: _roll
+	def _roll(self, now):
+		# Compute the layout only when the hour rolls over
+		if self._hstart is None or now >= self._hend or now < self._hstart:
+			lt = time.localtime(now)
+			self._hstart = int(now) - lt.tm_min * 60 - lt.tm_sec
+			self._hend = self._hstart + 3600
+			self._daydir = self._location + time.strftime("/%Y%m/%d", lt)
+			self._hourdir = self._daydir + time.strftime("/%H", lt)
+			self._hourname = self._name + time.strftime("-%Y%m%d-%H", lt)
+
+	# Method: getImagePath
+	def getImagePath(self, ext=".png", now=None):
+		if now is None:
+			now = time.time()
+		self._roll(now)
+		offset = int(now) - self._hstart
+		return self._ensure(self._hourdir) + os.path.sep + self._hourname + "%02d%02d-%06d" % (offset // 60, offset % 60, int((now - int(now)) * 1000000)) + ext
+
+	# Method: getVideoPath
+	def getVideoPath(self, ext=".avi", now=None):
+		if now is None:
+			now = time.time()
+		self._roll(now)
+		offset = int(now) - self._hstart
+		return self._ensure(self._daydir) + os.path.sep + self._hourname + "%02d%02d" % (offset // 60, offset % 60) + ext
+
+	# Method: getLogPath
+	def getLogPath(self, now=None):
+		if now is None:
+			now = time.time()
+		self._roll(now)
+		return self._ensure(self._daydir) + os.path.sep + self._hourname
+
+	# Method: getSamplePath
+	def getSamplePath(self, ext):
+		return self._ensure(self._location) + os.path.sep + self._name + "-calibration-sample" + ext
+
+	# Method: getName
+	def getName(self):
+		return self._name
+
+
+# Class: FrameLog
+class FrameLog:
+	# Constants
+	Encoding = ".jpg"
+	Data = ".pfl"
+	Index = ".pfi"
+	# Index record: timestamp, offset and length of the encoded frame
+	Record = struct.Struct("<dQI")
+
+	# Constructor
+	def __init__(self, path):
+		self._path = path
+		self._data = open(path + self.Data, 'ab')
+		self._index = open(path + self.Index, 'ab')
+		# Drop a partial index record (e.g. after a power failure) to keep the records aligned
+		self._index.seek(0, os.SEEK_END)
+		if self._index.tell() % self.Record.size != 0:
+			self._index.truncate(self._index.tell() - self._index.tell() % self.Record.size)
+			self._index.seek(0, os.SEEK_END)
+		self._data.seek(0, os.SEEK_END)
+		self._offset = self._data.tell()
+		self._frames = self._index.tell() / self.Record.size
+		self._flushed = time.time()
+
+	# Method: getPath
+	def getPath(self):
+		return self._path
+
+	# Method: getDataPath
+	def getDataPath(self):
+		return self._path + self.Data
+
+	# Method: getIndexPath
+	def getIndexPath(self):
+		return self._path + self.Index
+
+	# Method: getDataSize
+	def getDataSize(self):
+		return self._offset
+
+	# Method: getIndexSize
+	def getIndexSize(self):
+		return self._frames * self.Record.size
+
+	# Method: getFramesNumber
+	def getFramesNumber(self):
+		return self._frames
+
+	# Method: append
+	def append(self, timestamp, data, *fields):
+		self._data.write(data)
+		self._index.write(self.Record.pack(timestamp, self._offset, len(data), *fields))
+		self._offset += len(data)
+		self._frames += 1
+		# Make the frames visible to readers every second (data first, so the index never points to missing data)
+		if timestamp - self._flushed >= 1:
+			self.flush()
+		return len(data) + self.Record.size
+
+	# Method: flush
+	def flush(self):
+		self._data.flush()
+		self._index.flush()
+		self._flushed = time.time()
+
+	# Method: merge
+	def merge(self, path, buffersize=1048576):
+		# Append the frames of another frame log: its data is copied in large blocks and its index offsets are shifted
+		self.flush()
+		offset = self._offset
+		data = open(path + self.Data, 'rb')
+		try:
+			shutil.copyfileobj(data, self._data, buffersize)
+			self._offset += data.tell()
+		finally:
+			data.close()
+		index = open(path + self.Index, 'rb')
+		try:
+			while True:
+				block = index.read(self.Record.size * 4096)
+				count = len(block) / self.Record.size
+				if count == 0:
+					break
+				records = [self.Record.unpack_from(block, n * self.Record.size) for n in range(count)]
+				self._index.write("".join([self.Record.pack(record[0], record[1] + offset, *record[2:]) for record in records]))
+				self._frames += count
+		finally:
+			index.close()
+		self.flush()
+
+	# Method: close
+	def close(self):
+		self._data.close()
+		self._index.close()
+
+
+# Class: FrameLogReader
+class FrameLogReader:
+	# Constants
+	Log = FrameLog
+
+	# Constructor
+	def __init__(self, path):
+		# Accept the path of the frame log with or without extension
+		if path.endswith(self.Log.Data) or path.endswith(self.Log.Index):
+			path = path[:-len(self.Log.Data)]
+		self._path = path
+		self._data = open(path + self.Log.Data, 'rb')
+		self._index = open(path + self.Log.Index, 'rb')
+		dsize = os.fstat(self._data.fileno()).st_size
+		isize = os.fstat(self._index.fileno()).st_size
+		self._dmap = mmap.mmap(self._data.fileno(), 0, access=mmap.ACCESS_READ) if dsize > 0 else None
+		self._imap = mmap.mmap(self._index.fileno(), 0, access=mmap.ACCESS_READ) if isize > 0 else None
+		# Ignore the trailing records that point out of the data file (not yet flushed by the writer)
+		self._count = isize / self.Log.Record.size
+		while self._count > 0:
+			offset, length = self.getRecord(self._count - 1)[1:3]
+			if offset + length <= dsize:
+				break
+			self._count -= 1
+
+	# Method: __len__
+	def __len__(self):
+		return self._count
+
+	# Method: getRecord
+	def getRecord(self, index):
+		if index < 0 or index * self.Log.Record.size >= (len(self._imap) if self._imap is not None else 0):
+			raise IndexError("Frame index out of range: " + str(index))
+		return self.Log.Record.unpack_from(self._imap, index * self.Log.Record.size)
+
+	# Method: getTimestamp
+	def getTimestamp(self, index):
+		return self.getRecord(index)[0]
+
+	# Method: getData
+	def getData(self, index):
+		offset, length = self.getRecord(index)[1:3]
+		return self._dmap[offset:offset + length]
+
+	# Method: getFrame
+	def getFrame(self, index):
+		return cv2.imdecode(numpy.frombuffer(self.getData(index), dtype=numpy.uint8), cv2.IMREAD_COLOR)
+
+	# Method: find
+	def find(self, timestamp):
+		# Index of the first frame recorded at or after the specified timestamp
+		low, high = 0, self._count
+		while low < high:
+			middle = (low + high) // 2
+			if self.getTimestamp(middle) < timestamp:
+				low = middle + 1
+			else:
+				high = middle
+		return low
+
+	# Method: close
+	def close(self):
+		if self._dmap is not None:
+			self._dmap.close()
+		if self._imap is not None:
+			self._imap.close()
+		self._data.close()
+		self._index.close()
+
+
+# Class: RoiLog
+class RoiLog(FrameLog):
+	# Constants
+	Data = ".prl"
+	Index = ".pri"
+	Keyframe = 0
+	Crop = 1
+	# Index record: timestamp, offset and length of the encoded image, kind (keyframe or crop) and the crop box (x, y, width, height)
+	Record = struct.Struct("<dQIBHHHH")
+
+
+# Class: RoiLogReader
+class RoiLogReader(FrameLogReader):
+	# Constants
+	Log = RoiLog
+
+	# Constructor
+	def __init__(self, path):
+		FrameLogReader.__init__(self, path)
+		# Last reconstructed frame and its index, so a sequential read pastes only one crop
+		self._frame = None
+		self._position = None
+
+	# Method: isKeyframe
+	def isKeyframe(self, index):
+		return self.getRecord(index)[3] == RoiLog.Keyframe
+
+	# Method: getFrame
+	def getFrame(self, index):
+		# Reconstruct the full frame from the last keyframe and the crops recorded after it
+		start = index
+		while start > 0 and not self.isKeyframe(start):
+			start -= 1
+		if not self.isKeyframe(start):
+			return None
+		if self._frame is not None and start <= self._position <= index:
+			frame = self._frame
+			first = self._position + 1
+		else:
+			frame = FrameLogReader.getFrame(self, start)
+			first = start + 1
+		if frame is None:
+			return None
+		for position in range(first, index + 1):
+			_, _, _, _, x, y, width, height = self.getRecord(position)
+			crop = FrameLogReader.getFrame(self, position)
+			if crop is not None and crop.shape[0] == height and crop.shape[1] == width:
+				frame[y:y + height, x:x + width] = crop
+		self._frame = frame
+		self._position = index
+		return frame.copy()
+
+
+# Class: RetentionManager
+class RetentionManager:
+	# Constants
+	Sleeptime = 60
+
+	# Constructor
+	def __init__(self, camera, planner):
+		self._camera = camera
+		self._planner = planner
+		# Recording location (the planner might write into a staging area)
+		self._location = planner.getLocation()
+		# Catalog of recorded segments, it follows the files moved or deleted by retention and aging
+		self._catalog = RecordingCatalog.instance()
+		# Quota (MB) for recorded files, 0 means no quota
+		self._quota = 0
+		# Archive location, when it is not defined the old files are deleted
+		self._archive = None
+		# Incremental index of recorded files (oldest first) and their total size (bytes)
+		self._index = collections.deque()
+		self._size = 0
+		# Size (bytes) requested to be released because of disk space
+		self._release = 0
+		# Recent files found by the scan, they might be still written and registered again by recording service
+		self._recent = {}
+		self._lock = threading.Lock()
+		self._event = threading.Event()
+		self._running = False
+		self._thread = None
+
+	# Method: start
+	def start(self):
+		self._running = True
+		if self._thread is None or not self._thread.isAlive():
+			self._thread = threading.Thread(target=self.run)
+			self._thread.daemon = True
+			self._thread.start()
+
+	# Method: stop
+	def stop(self):
+		self._running = False
+		self._event.set()
+
+	# Method: getLocation
+	def getLocation(self):
+		return self._location
+
+	# Method: setLocation
+	def setLocation(self, location):
+		self._location = location
+
+	# Method: getQuota
+	def getQuota(self):
+		return self._quota
+
+	# Method: setQuota
+	def setQuota(self, quota):
+		self._quota = quota
+		self._event.set()
+
+	# Method: getArchive
+	def getArchive(self):
+		return self._archive
+
+	# Method: setArchive
+	def setArchive(self, archive):
+		self._archive = archive if archive is not None and archive.strip() != '' else None
+
+	# Method: register
+	def register(self, path, size, segment=None):
+		if segment is not None:
+			self._catalog.add(self._camera.id, path, segment)
+		with self._lock:
+			if self._recent and path in self._recent:
+				del self._recent[path]
+				self._index = collections.deque([entry for entry in self._index if entry[1] != path])
+				self._size = sum([entry[2] for entry in self._index])
+			self._index.append((time.time(), path, size))
+			self._size += size
+		if self._quota > 0 and self._size > self._quota * 1048576:
+			self._event.set()
+
+	# Method: extend
+	def extend(self, path, size, segment=None):
+		# Update the size of an indexed file that has grown (e.g. a frame log that was reopened), or register it
+		if segment is not None:
+			self._catalog.add(self._camera.id, path, segment)
+		with self._lock:
+			found = False
+			for index in range(len(self._index) - 1, -1, -1):
+				if self._index[index][1] == path:
+					self._size += size - self._index[index][2]
+					self._index[index] = (self._index[index][0], path, size)
+					self._recent.pop(path, None)
+					found = True
+					break
+		if not found:
+			self.register(path, size)
+		elif self._quota > 0 and self._size > self._quota * 1048576:
+			self._event.set()
+
+	# Method: getEntries
+	def getEntries(self):
+		with self._lock:
+			return list(self._index)
+
+	# Method: replace
+	def replace(self, sources, path, size, timestamp, step=1):
+		# Replace indexed files with the file that aggregates them, keeping the index ordered
+		self._catalog.replace(sources, path, size, step)
+		with self._lock:
+			sources = set(sources)
+			entries = [entry for entry in self._index if entry[1] not in sources and entry[1] != path]
+			entries.append((timestamp, path, size))
+			entries.sort()
+			self._index = collections.deque(entries)
+			self._size = sum([entry[2] for entry in entries])
+
+	# Method: release
+	def release(self, size):
+		# Ask to release disk space (KB) by purging the oldest files; returns false if there is nothing to purge
+		with self._lock:
+			if not self._index:
+				return False
+			self._release = max(self._release, size * 1024)
+		self._event.set()
+		return True
+
+	# Method: _scan
+	def _scan(self):
+		# Build the index once, afterwards it is maintained by recording service
+		location = self._location
+		files = []
+		for dirpath, dirnames, filenames in os.walk(location):
+			for filename in filenames:
+				if filename.startswith(self._planner.getName() + "-") and not filename.startswith(self._planner.getName() + "-calibration") and not filename.endswith(PreviewBuilder.Thumbnail):
+					try:
+						stat = os.stat(os.path.join(dirpath, filename))
+						files.append((stat.st_mtime, os.path.join(dirpath, filename), stat.st_size))
+					except OSError:
+						pass
+		files.sort()
+		with self._lock:
+			# Files registered during the scan are newer than the scanned ones
+			known = set([entry[1] for entry in self._index])
+			files = [entry for entry in files if entry[1] not in known]
+			self._index.extendleft(reversed(files))
+			self._size = sum([entry[2] for entry in self._index])
+			self._recent = dict([(entry[1], entry) for entry in files if entry[0] >= time.time() - 3600])
+		self._camera.log("Retention index contains " + str(len(self._index)) + " files having " + str(self._size / 1024) + " KB", "DEBUG")
+
+	# Method: _purge
+	def _purge(self, entry, delete=False):
+		location = self._location
+		path = entry[1]
+		try:
+			if self._archive is not None and not delete:
+				target = self._archive + path[len(location):] if path.startswith(location) else os.path.join(self._archive, os.path.basename(path))
+				if not os.path.isdir(os.path.dirname(target)):
+					os.makedirs(os.path.dirname(target))
+				shutil.move(path, target)
+				self._catalog.move(path, target)
+				if os.path.isfile(path + PreviewBuilder.Thumbnail):
+					shutil.move(path + PreviewBuilder.Thumbnail, target + PreviewBuilder.Thumbnail)
+			else:
+				os.remove(path)
+				self._catalog.remove(path)
+				if os.path.isfile(path + PreviewBuilder.Thumbnail):
+					os.remove(path + PreviewBuilder.Thumbnail)
+		except OSError:
+			pass
+		# Remove empty directories up to recording location
+		dirpath = os.path.dirname(path)
+		while dirpath.startswith(location + os.path.sep):
+			try:
+				os.rmdir(dirpath)
+				self._planner.forget(dirpath)
+			except OSError:
+				break
+			dirpath = os.path.dirname(dirpath)
+
+	# Method: _enforce
+	def _enforce(self):
+		count = 0
+		released = 0
+		while self._running:
+			with self._lock:
+				excess = self._size - self._quota * 1048576 if self._quota > 0 else 0
+				if not self._index or (excess <= 0 and self._release <= 0):
+					self._release = 0
+					break
+				entry = self._index.popleft()
+				self._size -= entry[2]
+				self._release -= entry[2]
+			self._purge(entry)
+			released += entry[2]
+			count += 1
+		if count > 0:
+			self._camera.log("Retention process has " + ("archived" if self._archive is not None else "deleted") + " " + str(count) + " files having " + str(released / 1024) + " KB")
+
+	# Method: remove
+	def remove(self, path):
+		# Delete an indexed file and the empty directories above it
+		self._purge((None, path, None), delete=True)
+
+	# Method: run
+	def run(self):
+		self._camera.log("Start a new thread to manage recordings retention", "DEBUG")
+		lowpriority()
+		try:
+			self._scan()
+			while self._running:
+				self._enforce()
+				self._event.wait(RetentionManager.Sleeptime)
+				self._event.clear()
+		except BaseException as baserr:
+			self._camera.log(["Retention process failed:", baserr])
+		self._camera.log("Stop the thread used to manage recordings retention", "DEBUG")
+
+
+# Class: AgingManager
+class AgingManager:
+	# Constants
+	Sleeptime = 600
+	Framerate = 2
+	# Process pool shared by all cameras
+	_pool = None
+	_plock = threading.Lock()
+
+	# Constructor
+	def __init__(self, camera, retention):
+		self._camera = camera
+		self._retention = retention
+		# Age thresholds (hours) of quality tiers, no threshold means no aging
+		self._thresholds = []
+		self._event = threading.Event()
+		self._running = False
+		self._thread = None
+
+	# Method: pool
+	@staticmethod
+	def pool():
+		with AgingManager._plock:
+			if AgingManager._pool is None:
+				AgingManager._pool = multiprocessing.Pool(processes=1, initializer=lowpriority)
+			return AgingManager._pool
+
+	# Method: start
+	def start(self):
+		self._running = True
+		if self._thresholds and (self._thread is None or not self._thread.isAlive()):
+			self._thread = threading.Thread(target=self.run)
+			self._thread.daemon = True
+			self._thread.start()
+
+	# Method: stop
+	def stop(self):
+		self._running = False
+		self._event.set()
+
+	# Method: getThresholds
+	def getThresholds(self):
+		return ','.join([str(threshold) for threshold in self._thresholds]) if self._thresholds else None
+
+	# Method: setThresholds
+	def setThresholds(self, thresholds):
+		if thresholds is None or str(thresholds).strip() == '' or str(thresholds).strip().lower() in ("off", "none"):
+			self._thresholds = []
+		else:
+			self._thresholds = sorted([any2int(threshold.strip(), error=True) for threshold in str(thresholds).split(',')])
+		if self._running:
+			self.start()
+			self._event.set()
+
+	# Method: _tier
+	def _tier(self, path):
+		match = re.search(r"-t(\d+)\.avi$", path)
+		return int(match.group(1)) if match else 0
+
+	# Method: _throttled
+	def _throttled(self):
+		# Live camera is slowed down (the frame rate is lower than recording calibration frame rate)
+		fps = self._camera.getCameraFps()
+		return fps is not None and fps < 0.8 * self._camera.getRecordingFrequency()
+
+	# Method: _candidates
+	def _candidates(self):
+		# Describe aging tasks: (sources, target, tier, timestamp) for images grouped per hour or for video files
+		tasks = []
+		stills = collections.OrderedDict()
+		# Hours (cam##-YYYYMMDD-HH file name prefix) having young files, their images are aggregated at once when all are old enough
+		young = set()
+		now = time.time()
+		for entry in self._retention.getEntries():
+			age = (now - entry[0]) / 3600
+			if age < self._thresholds[0]:
+				young.add(os.path.basename(entry[1])[:len("cam00-YYYYMMDD-HH")])
+				continue
+			if entry[1].endswith(".png"):
+				stills.setdefault(os.path.dirname(entry[1]), []).append(entry)
+			elif entry[1].endswith(FrameLog.Data):
+				# Frame log of one hour is aggregated (together with its index) in cam##-YYYYMMDD-HH-t1.avi file
+				path = entry[1][:-len(FrameLog.Data)]
+				tasks.append(([entry[1], path + FrameLog.Index], path + "-t1.avi", 1, entry[0]))
+			elif entry[1].endswith(".avi"):
+				tier = self._tier(entry[1])
+				if tier < len(self._thresholds) and age >= self._thresholds[tier]:
+					target = re.sub(r"(-t\d+)?\.avi$", "-t" + str(tier + 1) + ".avi", entry[1])
+					tasks.append(([entry[1]], target, tier + 1, entry[0]))
+		for dirpath, entries in stills.items():
+			# Images from cam##-YYYYMMDD-HHMMSS-ffffff.png files are aggregated in cam##-YYYYMMDD-HH-t1.avi file
+			name = os.path.basename(entries[0][1])[:len("cam00-YYYYMMDD-HH")]
+			if name in young:
+				continue
+			tasks.append(([entry[1] for entry in entries], os.path.join(os.path.dirname(dirpath), name + "-t1.avi"), 1, entries[0][0]))
+		# An existing target is never replaced (its sources are gone), the remaining sources are left to the retention
+		return [task for task in tasks if not os.path.exists(task[1])]
+
+	# Method: _process
+	def _process(self, sources, target, tier, timestamp):
+		# Images are only aggregated in a video file, the videos are downscaled and decimated for each tier
+		images = not sources[0].endswith(".avi")
+		scale = 1.0 if images else 0.5
+		step = 1 if images else 2
+		result = AgingManager.pool().apply_async(agingtask, (sources, target, scale, step, AgingManager.Framerate, self._camera.getRecordingFourcc()))
+		while not result.ready():
+			if not self._running:
+				return False
+			result.wait(1)
+		size = result.get()
+		if size > 0:
+			self._retention.replace(sources, target, size, timestamp, step)
+			for source in sources:
+				self._retention.remove(source)
+		return True
+
+	# Method: run
+	def run(self):
+		self._camera.log("Start a new thread to manage recordings aging", "DEBUG")
+		while self._running and self._thresholds:
+			try:
+				count = 0
+				for sources, target, tier, timestamp in self._candidates():
+					# Wait while the live camera is slowed down
+					while self._running and self._throttled():
+						self._event.wait(30)
+					if not self._running or not self._process(sources, target, tier, timestamp):
+						break
+					count += 1
+				if count > 0:
+					self._camera.log("Aging process has re-encoded " + str(count) + " recordings")
+			except BaseException as baserr:
+				self._camera.log(["Aging process failed:", baserr])
+			self._event.wait(AgingManager.Sleeptime)
+			self._event.clear()
+		self._camera.log("Stop the thread used to manage recordings aging", "DEBUG")
+
+
+# Class: StagingArea
+class StagingArea:
+	# Constants
+	Sleeptime = 30
+	Buffersize = 1048576
+
+	# Constructor
+	def __init__(self, camera, planner, retention):
+		self._camera = camera
+		self._planner = planner
+		self._retention = retention
+		# Staging location (RAM directory, e.g. tmpfs), when it is not defined the recordings are written directly
+		self._location = None
+		# Target location where the staged files are flushed (recording location)
+		self._target = planner.getLocation()
+		# Size bound (MB) of the staging area
+		self._bound = 64
+		# Completed files waiting to be flushed (oldest first): timestamp, recording path, staged path, size (bytes), frame log flag, segment metadata
+		self._queue = collections.deque()
+		self._size = 0
+		# Flush statistics: flushed size (bytes), time spent to flush it (seconds) and lag (seconds) of the last flushed file
+		self._flushed = 0
+		self._duration = 0
+		self._lag = 0
+		self._lock = threading.Lock()
+		self._flock = threading.Lock()
+		self._event = threading.Event()
+		self._running = False
+		self._thread = None
+
+	# Method: start
+	def start(self):
+		self._running = True
+		if self._thread is None or not self._thread.isAlive():
+			self._thread = threading.Thread(target=self.run)
+			self._thread.daemon = True
+			self._thread.start()
+
+	# Method: stop
+	def stop(self):
+		self._running = False
+		self._event.set()
+
+	# Method: isEnabled
+	def isEnabled(self):
+		return self._location is not None
+
+	# Method: getLocation
+	def getLocation(self):
+		return self._location
+
+	# Method: setLocation
+	def setLocation(self, location):
+		self._location = location.rstrip(os.path.sep) if location is not None and location.strip() != '' and location.lower() != 'default' else None
+
+	# Method: getTarget
+	def getTarget(self):
+		return self._target
+
+	# Method: setTarget
+	def setTarget(self, target):
+		self._target = target
+
+	# Method: getTargetPath
+	def getTargetPath(self, path):
+		# Path of a staged file after it is flushed
+		if self._location is not None and path.startswith(self._location):
+			return self._target + path[len(self._location):]
+		else:
+			return os.path.join(self._target, os.path.basename(path))
+
+	# Method: getBound
+	def getBound(self):
+		return self._bound
+
+	# Method: setBound
+	def setBound(self, bound):
+		self._bound = bound
+		self._event.set()
+
+	# Method: getPartSize
+	def getPartSize(self):
+		# Maximum size (bytes) of the file being written, so the staging area never exceeds its bound
+		return self._bound * 1048576 / 4
+
+	# Method: isFull
+	def isFull(self):
+		return self._size >= self._bound * 1048576 * 3 / 4
+
+	# Method: getThroughput
+	def getThroughput(self):
+		# Average flush throughput (KB/s)
+		return round(self._flushed / 1024.0 / self._duration, 2) if self._duration > 0 else 0
+
+	# Method: getLag
+	def getLag(self):
+		return round(self._lag, 2)
+
+	# Method: add
+	def add(self, path, size, log=None, segment=None):
+		# Queue a completed file; the log (FrameLog or RoiLog) of the current hour might be reopened so its closed part gets a unique name
+		part = path
+		if log is not None:
+			part = path + ".part" + str(int(time.time() * 1000))
+			os.rename(path + log.Data, part + log.Data)
+			os.rename(path + log.Index, part + log.Index)
+		with self._lock:
+			self._queue.append((time.time(), path, part, size, log, segment))
+			self._size += size
+		if self._size >= self._bound * 1048576 / 2:
+			self._event.set()
+
+	# Method: recover
+	def recover(self):
+		# Queue the files left in the staging area by a previous run (e.g. after a crash)
+		if not self.isEnabled() or not os.path.isdir(self._location):
+			return
+		name = self._planner.getName()
+		patterns = [(log, re.compile(r"^(.*?)(\.part\d+)?" + re.escape(log.Data) + "$")) for log in (FrameLog, RoiLog)]
+		count = 0
+		for dirpath, dirnames, filenames in os.walk(self._location):
+			for filename in sorted(filenames):
+				if not filename.startswith(name + "-") or filename.startswith(name + "-calibration") or filename.endswith(FrameLog.Index) or filename.endswith(RoiLog.Index):
+					continue
+				path = os.path.join(dirpath, filename)
+				log, match = next(((log, pattern.match(path)) for log, pattern in patterns if pattern.match(path) is not None), (None, None))
+				try:
+					if match is None:
+						self.add(path, os.path.getsize(path))
+					elif match.group(2) is None:
+						self.add(match.group(1), os.path.getsize(path) + os.path.getsize(match.group(1) + log.Index), log)
+					else:
+						with self._lock:
+							self._queue.append((os.path.getmtime(path), match.group(1), match.group(1) + match.group(2), os.path.getsize(path), log, None))
+							self._size += os.path.getsize(path)
+					count += 1
+				except OSError:
+					pass
+		if count > 0:
+			self._camera.log("Staging area recovered " + str(count) + " files left by a previous run")
+			self._event.set()
+
+	# Method: flush
+	def flush(self):
+		# Flush the queued files and, if the target location can not keep up, drop the oldest ones to keep the bound
+		with self._flock:
+			self._flush()
+			if self.isFull():
+				self._shed()
+
+	# Method: drain
+	def drain(self):
+		# Flush everything (e.g. on shutdown); the files that can not be flushed remain in the staging area to be recovered
+		self.flush()
+		if self._queue:
+			self._camera.log("Staging area could not flush " + str(len(self._queue)) + " files having " + str(self._size / 1024) + " KB", "WARN")
+
+	# Method: _flush
+	def _flush(self):
+		start = time.time()
+		count = 0
+		size = 0
+		while True:
+			with self._lock:
+				if not self._queue:
+					break
+				entry = self._queue[0]
+			target = self.getTargetPath(entry[1])
+			try:
+				if not os.path.isdir(os.path.dirname(target)):
+					os.makedirs(os.path.dirname(target))
+				if entry[4] is not None:
+					self._merge(entry[2], target, entry[4], entry[5])
+				else:
+					self._move(entry[2], target, entry[5])
+			except (IOError, OSError) as baserr:
+				self._camera.log(["Staging area failed to flush " + entry[2] + ":", baserr])
+				break
+			with self._lock:
+				self._queue.popleft()
+				self._size -= entry[3]
+			count += 1
+			size += entry[3]
+			self._lag = time.time() - entry[0]
+		if count > 0:
+			duration = time.time() - start
+			self._flushed += size
+			self._duration += duration
+			self._camera.log("Staging area flushed " + str(count) + " files having " + str(size / 1024) + " KB in " + str(round(duration, 2)) + " seconds (" + str(self.getThroughput()) + " KB/s, lag " + str(self.getLag()) + " seconds)", "DEBUG")
+
+	# Method: _move
+	def _move(self, source, target, segment=None):
+		# Copy with large sequential writes (tmpfs and SD card are different file systems)
+		input = open(source, 'rb')
+		try:
+			output = open(target, 'wb')
+			try:
+				shutil.copyfileobj(input, output, StagingArea.Buffersize)
+			finally:
+				output.close()
+		finally:
+			input.close()
+		os.remove(source)
+		self._retention.register(target, os.path.getsize(target), segment)
+
+	# Method: _merge
+	def _merge(self, source, target, log=FrameLog, segment=None):
+		# Append a frame log part to the frame log of the same hour from target location
+		framelog = log(target)
+		try:
+			framelog.merge(source, StagingArea.Buffersize)
+		finally:
+			framelog.close()
+		os.remove(source + log.Data)
+		os.remove(source + log.Index)
+		self._retention.extend(framelog.getDataPath(), framelog.getDataSize(), segment)
+		self._retention.extend(framelog.getIndexPath(), framelog.getIndexSize())
+
+	# Method: _shed
+	def _shed(self):
+		count = 0
+		size = 0
+		while self.isFull():
+			with self._lock:
+				if not self._queue:
+					break
+				entry = self._queue.popleft()
+				self._size -= entry[3]
+			for path in ([entry[2] + entry[4].Data, entry[2] + entry[4].Index] if entry[4] is not None else [entry[2]]):
+				try:
+					os.remove(path)
+				except OSError:
+					pass
+			count += 1
+			size += entry[3]
+		if count > 0:
+			self._camera.log("Staging area dropped " + str(count) + " files having " + str(size / 1024) + " KB because recording location can not keep up", "WARN")
+
+	# Method: run
+	def run(self):
+		self._camera.log("Start a new thread to flush recordings staging area", "DEBUG")
+		while self._running:
+			self._event.wait(StagingArea.Sleeptime)
+			self._event.clear()
+			try:
+				self.flush()
+			except BaseException as baserr:
+				self._camera.log(["Staging area flush failed:", baserr])
+		self._camera.log("Stop the thread used to flush recordings staging area", "DEBUG")
+
+
+# Class: PreviewBuilder
+class PreviewBuilder:
+	# Constants
+	Thumbnail = ".thumb.jpg"
+	Strip = ".strip.jpg"
+	Width = 160
+	Period = 300
+	Sleeptime = 60
+
+	# Constructor
+	def __init__(self, camera, retention):
+		self._camera = camera
+		self._retention = retention
+		# Pending previews (oldest first): kind, path, downscaled frame and timestamp
+		self._queue = collections.deque()
+		# Hourly strip: path, tiles of the current hour and timestamp of the last tile
+		self._strip = None
+		self._tiles = []
+		self._tiled = None
+		self._lock = threading.Lock()
+		self._event = threading.Event()
+		self._running = False
+		self._thread = None
+
+	# Method: start
+	def start(self):
+		self._running = True
+		if self._thread is None or not self._thread.isAlive():
+			self._thread = threading.Thread(target=self.run)
+			self._thread.daemon = True
+			self._thread.start()
+
+	# Method: stop
+	def stop(self):
+		self._running = False
+		self._event.set()
+
+	# Method: shrink
+	@staticmethod
+	def shrink(frame):
+		# Downscaled copy of a frame in memory, the only work done in recording thread
+		return cv2.resize(frame, (PreviewBuilder.Width, PreviewBuilder.Width * numpy.size(frame, 0) / numpy.size(frame, 1)), interpolation=cv2.INTER_AREA)
+
+	# Method: isTileDue
+	def isTileDue(self, timestamp):
+		return self._tiled is None or timestamp - self._tiled >= PreviewBuilder.Period or time.localtime(timestamp).tm_hour != time.localtime(self._tiled).tm_hour
+
+	# Method: addThumbnail
+	def addThumbnail(self, path, image):
+		with self._lock:
+			self._queue.append(("thumbnail", path + PreviewBuilder.Thumbnail, image, time.time()))
+		self._event.set()
+
+	# Method: addTile
+	def addTile(self, path, image, timestamp):
+		self._tiled = timestamp
+		with self._lock:
+			self._queue.append(("tile", path, image, timestamp))
+		self._event.set()
+
+	# Method: _write
+	def _write(self, path, image):
+		if not os.path.isdir(os.path.dirname(path)):
+			os.makedirs(os.path.dirname(path))
+		data = cv2.imencode(".jpg", image)[1].tostring()
+		file = open(path, 'wb')
+		try:
+			file.write(data)
+		finally:
+			file.close()
+		return len(data)
+
+	# Method: _tile
+	def _tile(self, path, image, timestamp):
+		# Add a tile to the strip of its hour; the strip written by a previous run is continued
+		if path != self._strip:
+			self._strip = path
+			self._tiles = []
+			if os.path.isfile(path):
+				strip = cv2.imread(path)
+				if strip is not None and numpy.size(strip, 0) == numpy.size(image, 0):
+					self._tiles.append(strip)
+		cv2.putText(image, time.strftime("%H:%M", time.localtime(timestamp)), (4, 12), cv2.FONT_HERSHEY_PLAIN, 0.8, (255, 255, 255))
+		self._tiles.append(image)
+		# The strip is registered for retention, so it is purged or archived together with the recordings of its hour
+		self._retention.extend(path, self._write(path, numpy.hstack(self._tiles)))
+
+	# Method: run
+	def run(self):
+		self._camera.log("Start a new thread to build recordings previews", "DEBUG")
+		lowpriority()
+		while self._running or self._queue:
+			self._event.wait(PreviewBuilder.Sleeptime)
+			self._event.clear()
+			while self._queue:
+				with self._lock:
+					kind, path, image, timestamp = self._queue.popleft()
+				try:
+					if kind == "tile":
+						self._tile(path, image, timestamp)
+					elif not os.path.isfile(path):
+						# One thumbnail per file: the next segments of a frame log keep the first one
+						self._write(path, image)
+				except BaseException as baserr:
+					self._camera.log(["Preview of " + path + " failed:", baserr])
+		self._camera.log("Stop the thread used to build recordings previews", "DEBUG")
 
 
 # Class: CamStreaming
@@ -938,12 +2995,13 @@ class StreamingService(CamService):
 	def start(self):
 		if self._camera.isCameraOn:
 			try:
-				self._stream = StreamingServer((self._iface, self._port), StreamHandler, frame=None, sleep=self._sleep)
-				streamthread = threading.Thread(target=self._stream.serve_forever)
-				streamthread.daemon = True
-				streamthread.start()
+				self._stream = StreamingServer((self._iface, self._port) if self._port > 0 else None, frame=None, sleep=self._sleep)
+				StreamingRouter.instance().attach(self._camera.id, self._stream)
 				self._running = True
-				self._camera.log("Streaming started on " + str(self._stream.server_address))
+				if self._stream.server_address is not None:
+					self._camera.log("Streaming started on " + str(self._stream.server_address))
+				else:
+					self._camera.log("Streaming started on shared endpoint only")
 			except IOError as ioerr:
 				self._camera.log(["Streaming initialization failed:", ioerr])
 				self._stream = None
@@ -953,8 +3011,8 @@ class StreamingService(CamService):
 	def stop(self):
 		if self._stream is not None:
 			try:
-				self._stream.shutdown()
-				self._stream.server_close()
+				StreamingRouter.instance().detach(self._camera.id, self._stream)
+				self._stream.close()
 				self._stream = None
 			except IOError as ioerr:
 				self._camera.log(["Streaming function has been stopped with errors:", ioerr])
@@ -973,6 +3031,10 @@ class StreamingService(CamService):
 	def getStreamingSleep(self):
 		return self._sleep
 
+	# Method: getStreamingClients
+	def getStreamingClients(self):
+		return self._stream.getClients() if self._stream is not None else 0
+
 	# Method: setStreamingSleep
 	def setStreamingSleep(self, sleeptime):
 		self._sleep = sleeptime
@@ -1049,12 +3111,23 @@ class RulingEngine(CamService):
 				self._camera.setRecordingMessage("Motion +")
 				self._camera.setRecordingPause(False)
 			else:
-				if (self._camera.getRecordingLastTimestamp() - self._camera.getMotionLastTimestamp()).total_seconds() < 10:
+				lastrec = self._camera.getRecordingLastTimestamp()
+				lastmot = self._camera.getMotionLastTimestamp()
+				if lastrec is not None and lastmot is not None and (lastrec - lastmot).total_seconds() < 10:
 					self._camera.setRecordingMessage("Motion -")
 					self._camera.setRecordingPause(False)
 				else:
-					self._camera.setFrameLabel(frame, "Standby")
-					self._camera.setRecordingPause(True)
+					# Idle periods are recorded at low rate (one frame every RecordingIdletime seconds), when it is set; only the
+					# formats keeping the time of each frame are sampled (a video would play the idle periods time-compressed)
+					idletime = self._camera.getRecordingIdletime()
+					if idletime > 0 and self._camera.getRecordingFormat() in ('image', 'framelog') and (lastrec is None or (datetime.datetime.now() - lastrec).total_seconds() >= idletime):
+						self._camera.setRecordingMessage("Idle")
+						self._camera.setRecordingPause(False)
+						# The sample is taken now, even when the frame is not written (e.g. it is a duplicate)
+						self._camera.setRecordingLastTimestamp(datetime.datetime.now())
+					else:
+						self._camera.setFrameLabel(frame, "Standby")
+						self._camera.setRecordingPause(True)
 
 	# Method: _R2
 	def _R2(self, frame):
@@ -1063,16 +3136,21 @@ class RulingEngine(CamService):
 			if self._r2cronos is None:
 				self._r2cronos = datetime.datetime.now()
 			else:
-				if (self._camera.getRecordingLastTimestamp() - self._r2cronos).total_seconds() >= 6 * 3600:
+				# Nothing has been recorded yet when a reused calibration profile skipped the calibration run
+				lastrec = self._camera.getRecordingLastTimestamp()
+				if lastrec is not None and (lastrec - self._r2cronos).total_seconds() >= 6 * 3600:
 					self._r2cronos = None
 					self._camera.setRecordingNewFile()
 					self._camera.log("R2: Reset recording output file", "DEBUG")
 
 	# Method: _R3
 	def _R3(self, frame):
-		# R3: when recording is activated and no enough space available to continue recording it will stop the recording process
+		# R3: when recording is activated and no enough space available to continue recording it will purge the oldest recordings or,
+		# if there is nothing to purge, it will stop the recording process
 		if self._resinfo["disk"] is not None and (300 * self._camera.getRecordingAvgFrameSize() >= int(self._resinfo["disk"]["available"])):
-			if self._camera.isCameraRecordingOn():
+			if self._camera.isCameraRecordingOn() and self._camera.releaseRecordingSpace(600 * self._camera.getRecordingAvgFrameSize() - int(self._resinfo["disk"]["available"])):
+				self._camera.log("R3: The oldest recordings will be purged because '" + str(self._resinfo["disk"]["mountpoint"]) + "' file system is almost full (it has " + str(self._resinfo["disk"]["available"]) + "KB available space)", "WARN")
+			elif self._camera.isCameraRecordingOn():
 				self._camera.log("R3: Recording process will be stopped because '" + str(self._resinfo["disk"]["mountpoint"]) + "' file system will is almost full (it has " + str(self._resinfo["disk"]["available"]) + "KB available space)", "WARN")
 				self._camera.setCameraRecording(False)
 				self._r3action = True
@@ -1108,62 +3186,529 @@ class RulingEngine(CamService):
 				self._r4action2 = False
 
 
-# Class: StreamHandler
-class StreamHandler(BaseHTTPRequestHandler):
+# Class: StreamingClient
+class StreamingClient:
+	# Constants
+	Requestsize = 8192
+	Stalltime = 10
+	Window = 10
+	# Adaptive quality: tiers (scale, JPEG quality and frame size relative to the first tier) and evaluation period (seconds)
+	Tiers = [(1.0, 75, 1.0), (1.0, 50, 0.7), (0.5, 60, 0.25), (0.5, 40, 0.18), (0.25, 40, 0.06)]
+	Adaptation = 3
+	Header = "HTTP/1.0 200 OK\r\nServer: PiCam\r\nConnection: close\r\nMax-Age: 0\r\nExpires: 0\r\nCache-Control: no-cache, private\r\nPragma: no-cache\r\nContent-Type: multipart/x-mixed-replace; boundary=--jpgboundary\r\n\r\n"
+
 	# Constructor
-	def __init__(self, request, client_address, server):
-		self._server = server
-		BaseHTTPRequestHandler.__init__(self, request, client_address, server)
+	def __init__(self, sock, owner, address=None):
+		self._socket = sock
+		self._address = address
+		# Owner of the listening socket routes the request (to a stream or to a content), the stream is known after routing
+		self._owner = owner
+		self._stream = None
+		self._request = ""
+		# Output buffers (shared chunks are never copied) and the offset written from the first one
+		self._output = collections.deque()
+		self._offset = 0
+		# Sequence number and time of the last sent frame, frame rate cap (e.g. /?fps=5), stream profile and the streaming flag
+		self._sequence = 0
+		self._sent = 0
+		self._fps = None
+		self._profile = None
+		self._streaming = False
+		self._closing = False
+		# Backpressure: time of the last write progress, a frame missed while the client was busy, delivered and dropped frames
+		self._progress = time.time()
+		self._busy = False
+		self._delivered = 0
+		self._dropped = 0
+		# Rate window (start time, delivered and dropped frames) and the rates measured in the last window
+		self._window = (time.time(), 0, 0)
+		self._rates = (0.0, 0.0)
+		# Adaptive quality: flag, current tier, time when the frame in output was queued, written bytes and busy time (the
+		# frame was waiting for the socket) of the evaluation period, its start, dropped and delivered frames, last throughput (bytes/s)
+		self._adaptive = False
+		self._tier = 0
+		self._queued = None
+		self._bytes = 0
+		self._busytime = 0
+		self._adapted = (time.time(), 0, 0)
+		self._throughput = None
+
+	# Method: fileno
+	def fileno(self):
+		return self._socket.fileno()
+
+	# Method: getStream
+	def getStream(self):
+		return self._stream
+
+	# Method: isClosing
+	def isClosing(self):
+		return self._closing and not self._output
+
+	# Method: isOrphan
+	def isOrphan(self):
+		return self._stream is not None and self._stream.isClosed()
+
+	# Method: isStreaming
+	def isStreaming(self):
+		return self._streaming
+
+	# Method: hasOutput
+	def hasOutput(self):
+		return len(self._output) > 0
+
+	# Method: read
+	def read(self):
+		# Read the request, the streaming starts when the request headers are complete; False when the client is gone
+		data = self._socket.recv(StreamingClient.Requestsize)
+		if not data:
+			return False
+		if self._streaming or self._closing:
+			return True
+		self._request += data
+		if "\r\n\r\n" not in self._request and "\n\n" not in self._request:
+			if len(self._request) > StreamingClient.Requestsize:
+				self.reply("400 Bad Request")
+			return True
+		fields = self._request.split(None, 2)
+		if len(fields) < 2 or fields[0] != "GET":
+			self.reply("405 Method Not Allowed")
+			return True
+		url = urlparse.urlparse(fields[1])
+		query = urlparse.parse_qs(url.query)
+		route = self._owner.route(url.path, query)
+		if route is None:
+			self.reply("404 Not Found")
+		elif route[0] == "stream":
+			self._stream = route[1]
+			self._stream.connect()
+			self._fps = any2float(query.get("fps", [None])[0])
+			self._profile = self._stream.acquire(any2int(query.get("w", [None])[0]), any2int(query.get("q", [None])[0]))
+			# Quality follows the client throughput unless the profile is set by the client or the adaptation is disabled (adaptive=0)
+			self._adaptive = "w" not in query and "q" not in query and any2bool(query.get("adaptive", ["1"])[0])
+			self._streaming = True
+		elif route[0] == "snapshot":
+			self.snapshot(route[1])
+		elif route[0] == "content" and route[2] is not None:
+			self.reply("200 OK", route[1], route[2])
+		else:
+			self.reply("503 Service Unavailable")
+		return True
+
+	# Method: getHeader
+	def getHeader(self, name):
+		for line in self._request.splitlines()[1:]:
+			if ":" in line and line.split(":", 1)[0].strip().lower() == name.lower():
+				return line.split(":", 1)[1].strip()
+		return None
+
+	# Method: snapshot
+	def snapshot(self, stream):
+		# Last encoded frame of the stream, the entity tag (stream and frame sequence number) lets the pollers revalidate it
+		sequence, jpeg = stream.getSnapshot()
+		if jpeg is None:
+			self.reply("503 Service Unavailable", headers=["Retry-After: 1"])
+			return
+		etag = '"' + stream.getTag() + "-" + str(sequence) + '"'
+		match = self.getHeader("If-None-Match")
+		if match is not None and (match == "*" or etag in [value.strip() for value in match.split(",")]):
+			self.reply("304 Not Modified", headers=["ETag: " + etag])
+		else:
+			self.reply("200 OK", "image/jpeg", jpeg, headers=["ETag: " + etag])
+
+	# Method: reply
+	def reply(self, status, type=None, body="", headers=[]):
+		header = "HTTP/1.0 " + status + "\r\nServer: PiCam\r\nConnection: close\r\nCache-Control: no-cache, private\r\n"
+		if type is not None:
+			header += "Content-Type: " + type + "\r\n"
+		for line in headers:
+			header += line + "\r\n"
+		self._output.append(header + "Content-Length: " + str(len(body)) + "\r\n\r\n")
+		if len(body) > 0:
+			self._output.append(body)
+		self._closing = True
+
+	# Method: due
+	def due(self):
+		# Time when the next frame could be sent to the client (server sleep time and client frame rate cap)
+		return self._sent + max(self._stream.getSleep(), 1.0 / self._fps if self._fps is not None and self._fps > 0 else 0)
+
+	# Method: push
+	def push(self, now):
+		# Queue the last frame when it is new, it is due and the previous one has been completely written (one frame slot:
+		# a slow client skips the frames produced while it is busy and gets the latest one)
+		if not self._streaming:
+			return False
+		number, chunk = self._stream.getData(self._profile)
+		if chunk is None or number == self._sequence:
+			return False
+		if self._output:
+			self._busy = True
+			return False
+		if now < self.due():
+			return False
+		# The response header is sent with the first frame
+		if self._sequence == 0:
+			self._output.append(StreamingClient.Header)
+		elif self._busy:
+			self._dropped += number - self._sequence - 1
+		self._queued = now
+		self._output.append(chunk)
+		self._sequence = number
+		self._sent = now
+		self._progress = now
+		self._busy = False
+		return True
+
+	# Method: adapt
+	def adapt(self, now):
+		# Compare the client throughput with the bandwidth of the current tier (its frame size at the frame rate offered to the
+		# client): step down when the link can not carry it, up when the link could carry the upper tier with some headroom
+		elapsed = now - self._adapted[0]
+		if not self._adaptive or elapsed < StreamingClient.Adaptation:
+			return
+		# The frame still waiting for the socket is busy time of this period
+		if self._output and self._queued is not None:
+			self._busytime += now - max(self._queued, self._adapted[0])
+		dropped = self._dropped - self._adapted[1]
+		delivered = self._delivered - self._adapted[2]
+		if self._busytime > 0:
+			self._throughput = int(self._bytes / self._busytime)
+		tier = self._tier
+		if delivered > 0 and self._busytime > 0:
+			needed = (float(self._bytes) / delivered) * (float(delivered + dropped) / elapsed)
+			if dropped > 0 and self._throughput < needed and tier < len(StreamingClient.Tiers) - 1:
+				tier += 1
+			elif dropped == 0 and tier > 0 and self._throughput > 1.5 * needed * StreamingClient.Tiers[tier - 1][2] / StreamingClient.Tiers[tier][2]:
+				tier -= 1
+		elif dropped > 0 and tier < len(StreamingClient.Tiers) - 1:
+			# Not even one frame has been written in this period
+			tier += 1
+		if tier != self._tier:
+			scale, quality = StreamingClient.Tiers[tier][:2]
+			width = self._stream.getWidth()
+			profile = self._stream.acquire(int(width * scale) if scale < 1 and width is not None else None, quality)
+			if profile is not None or tier == 0:
+				self._stream.release(self._profile)
+				self._profile = profile
+				self._tier = tier
+			else:
+				self._stream.release(profile)
+		self._adapted = (now, self._dropped, self._delivered)
+		self._bytes = 0
+		self._busytime = 0
+
+	# Method: isStalled
+	def isStalled(self, now):
+		# The client did not take any data for too long
+		return len(self._output) > 0 and now - self._progress > StreamingClient.Stalltime
+
+	# Method: getStalltime
+	def getStalltime(self):
+		return self._progress + StreamingClient.Stalltime
+
+	# Method: getStats
+	def getStats(self, now):
+		# Delivered and dropped frame rates measured over the last window
+		elapsed = now - self._window[0]
+		if elapsed >= StreamingClient.Window:
+			self._rates = (round((self._delivered - self._window[1]) / elapsed, 2), round((self._dropped - self._window[2]) / elapsed, 2))
+			self._window = (now, self._delivered, self._dropped)
+		return {"address":(self._address[0] if self._address is not None else None), "profile":self._profile, "delivered":self._delivered, "dropped":self._dropped, "deliveredfps":self._rates[0], "droppedfps":self._rates[1], "tier":(self._tier if self._adaptive else None), "throughput":(self._throughput / 1024 if self._throughput is not None else None)}
+
+	# Method: write
+	def write(self):
+		# Non-blocking write of the queued buffers, it returns when the socket can not take more data
+		while self._output:
+			data = self._output[0]
+			try:
+				count = self._socket.send(buffer(data, self._offset))
+			except socket.error as err:
+				if err.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+					return
+				raise
+			self._offset += count
+			if count > 0:
+				self._progress = time.time()
+			if self._offset < len(data):
+				return
+			self._output.popleft()
+			self._offset = 0
+			if self._streaming and not self._output:
+				self._delivered += 1
+				self._bytes += len(data)
+				self._busytime += time.time() - max(self._queued, self._adapted[0])
+
+	# Method: close
+	def close(self):
+		if self._streaming:
+			self._stream.release(self._profile)
+			self._stream.disconnect()
+		try:
+			self._socket.close()
+		except socket.error:
+			pass
+
+
+# Class: StreamingEngine
+class StreamingEngine:
+	# Constants
+	Backlog = 64
+	# Socket send buffer of the clients: a small one makes a slow link visible after a few frames instead of after megabytes
+	Sendbuffer = 131072
+	# Shared instance, one event loop for all cameras
+	_instance = None
+	_ilock = threading.Lock()
 
-	# Method: do_GET
-	def do_GET(self):
+	# Constructor
+	def __init__(self):
+		self._poll = select.poll()
+		# Listening sockets and connected clients by file descriptor
+		self._listeners = {}
+		self._clients = {}
+		self._lock = threading.Lock()
+		# Wake up the event loop when a new frame is encoded or a stream is closed
+		self._wakeup = socket.socketpair()
+		self._wakeup[0].setblocking(0)
+		self._wakeup[1].setblocking(0)
+		self._poll.register(self._wakeup[0].fileno(), select.POLLIN)
+		self._thread = None
+
+	# Method: instance
+	@staticmethod
+	def instance():
+		with StreamingEngine._ilock:
+			if StreamingEngine._instance is None:
+				StreamingEngine._instance = StreamingEngine()
+			return StreamingEngine._instance
+
+	# Method: listen
+	def listen(self, address, owner):
+		# Open a listening socket for a stream or a router, the clients are served by the event loop thread
+		sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 		try:
-			self.send_response(200)
-			self.send_header("Connection", "close")
-			self.send_header("Max-Age", "0")
-			self.send_header("Expires", "0")
-			self.send_header("Cache-Control", "no-cache, private")
-			self.send_header("Pragma", "no-cache")
-			self.send_header("Content-Type", "multipart/x-mixed-replace; boundary=--jpgboundary")
-			self.end_headers()
-			while True:
-				if self._server.getData() is None:
+			sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+			sock.bind(address)
+			sock.listen(StreamingEngine.Backlog)
+			sock.setblocking(0)
+		except socket.error:
+			sock.close()
+			raise
+		with self._lock:
+			self._listeners[sock.fileno()] = (sock, owner)
+			self._poll.register(sock.fileno(), select.POLLIN)
+			if self._thread is None:
+				self._thread = threading.Thread(target=self.run)
+				self._thread.daemon = True
+				self._thread.start()
+		# The running event loop polls the new socket from its next iteration
+		self.notify()
+		return sock
+
+	# Method: close
+	def close(self, owner):
+		# Close the listening socket of a stream or a router, the clients of closed streams are disconnected by the event loop thread
+		with self._lock:
+			for fileno, (sock, listener) in self._listeners.items():
+				if listener is owner:
+					self._poll.unregister(fileno)
+					del self._listeners[fileno]
+					sock.close()
+		self.notify()
+
+	# Method: notify
+	def notify(self):
+		try:
+			self._wakeup[1].send("x")
+		except socket.error:
+			pass
+
+	# Method: getStats
+	def getStats(self, stream):
+		now = time.time()
+		return [client.getStats(now) for client in self._clients.values() if client.getStream() is stream]
+
+	# Method: _drop
+	def _drop(self, fileno):
+		client = self._clients.pop(fileno, None)
+		if client is not None:
+			try:
+				self._poll.unregister(fileno)
+			except (KeyError, select.error):
+				pass
+			client.close()
+
+	# Method: _accept
+	def _accept(self, listener):
+		sock, owner = listener
+		while True:
+			try:
+				connection, address = sock.accept()
+			except socket.error as err:
+				if err.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+					return
+				raise
+			connection.setblocking(0)
+			connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+			connection.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, StreamingEngine.Sendbuffer)
+			client = StreamingClient(connection, owner, address)
+			self._clients[client.fileno()] = client
+			self._poll.register(client.fileno(), select.POLLIN)
+
+	# Method: run
+	def run(self):
+		# Event loop: accept clients, read their requests and write the encoded frames with non-blocking sockets
+		while True:
+			now = time.time()
+			# Queue the new frames and write as much as the sockets can take
+			timeout = None
+			for fileno, client in self._clients.items():
+				try:
+					# Disconnect the clients of closed streams and the clients that stalled
+					if client.isOrphan() or client.isStalled(now):
+						self._drop(fileno)
+						continue
+					client.adapt(now)
+					if client.push(now) or client.hasOutput():
+						client.write()
+					if client.isClosing():
+						self._drop(fileno)
+						continue
+					self._poll.modify(fileno, select.POLLIN | select.POLLOUT if client.hasOutput() else select.POLLIN)
+					wakeup = client.getStalltime() if client.hasOutput() else (client.due() if client.isStreaming() and client.due() > now else None)
+					if wakeup is not None:
+						timeout = min(timeout, wakeup - now) if timeout is not None else wakeup - now
+				except BaseException:
+					self._drop(fileno)
+			# Stop the event loop when all streams are closed (it is started again by the next stream)
+			with self._lock:
+				if not self._listeners and not self._clients:
+					self._thread = None
+					return
+			try:
+				events = self._poll.poll(int(max(0, timeout) * 1000) + 1 if timeout is not None else None)
+			except select.error as err:
+				if err.args[0] == errno.EINTR:
 					continue
-				frameRGB = cv2.cvtColor(self._server.getData(), cv2.COLOR_BGR2RGB)
-				jpg = Image.fromarray(frameRGB)
-				buffer = StringIO.StringIO()
-				jpg.save(buffer, 'JPEG')
-				self.wfile.write("--jpgboundary\n")
-				self.send_header("Content-type", "image/jpeg")
-				self.send_header('Content-length',str(buffer.len))
-				self.end_headers()
-				jpg.save(self.wfile, 'JPEG')
-				time.sleep(self._server.getSleep())
-			return
-		except BaseException as baseerr:
-			self.send_error(500, 'PiCam Streaming Server Error: \n\n%s' % str(baseerr))
-			if __verbose__:
-				traceback.print_exc()
+				raise
+			for fileno, event in events:
+				with self._lock:
+					listener = self._listeners.get(fileno)
+				try:
+					if fileno == self._wakeup[0].fileno():
+						while self._wakeup[0].recv(4096):
+							pass
+					elif listener is not None:
+						self._accept(listener)
+					elif fileno in self._clients:
+						if event & (select.POLLERR | select.POLLHUP | select.POLLNVAL):
+							self._drop(fileno)
+						elif event & select.POLLIN and not self._clients[fileno].read():
+							self._drop(fileno)
+				except socket.error as err:
+					if err.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+						self._drop(fileno)
 
 
 # Class: StreamingServer
-class StreamingServer(ThreadingMixIn, HTTPServer):
-	allow_reuse_address = True
-	daemon_threads = True
+class StreamingServer:
+	# Constants
+	Quality = 75
+	Variants = 4
 
 	# Constructor
-	def __init__(self, server_address, handler, bind_and_activate=True, frame=None, sleep=0.01):
-		HTTPServer.__init__(self, server_address, handler, bind_and_activate=bind_and_activate)
-		self._frame = frame
+	def __init__(self, server_address, frame=None, sleep=0.01):
 		self._sleep = sleep
-
-	# Method: getFrame
-	def getData(self):
-		return self._frame
-
-	# Method: getFrame
+		# Sequence number of the last encoded frame, its multipart chunk and the chunks of the profile variants (immutable,
+		# replaced for each new frame), the last sequence number and the last frame not encoded because nobody was watching
+		self._data = (0, None, {})
+		self._sequence = 0
+		self._pending = None
+		# A snapshot asked for a newer frame, the camera thread encodes its next frame even without viewers
+		self._snapshot = False
+		# Sequence number and reference of the last frame (it is not copied), used to compose the mosaic streams
+		self._frame = (0, None)
+		# Number of the clients watching the stream, the frames are encoded only when there is at least one
+		self._viewers = 0
+		# Profiles (width, quality) requested by the clients and the number of clients using each of them
+		self._profiles = {}
+		self._lock = threading.Lock()
+		self._width = None
+		self._closed = False
+		# Stream tag, it makes the snapshot entity tags unique across stream restarts
+		self._tag = "%x" % int(time.time() * 1000)
+		# Clients are served by the shared streaming engine (one thread for all cameras)
+		self._engine = StreamingEngine.instance()
+		self.setData(frame)
+		# Own listening port, it is optional when the stream is published by the shared endpoint
+		self.server_address = None
+		if server_address is not None:
+			self.server_address = self._engine.listen(server_address, self).getsockname()
+
+	# Method: getData
+	def getData(self, profile=None):
+		# Sequence number and chunk of the last frame for a profile (no chunk until the next frame for a new profile or
+		# when the stream was idle, so the first viewer does not get an old frame)
+		sequence, chunk, variants = self._data
+		if self._pending is not None:
+			return sequence, None
+		if profile is None:
+			return sequence, chunk
+		return sequence, variants.get(profile)
+
+	# Method: setData
 	def setData(self, frame):
-		self._frame = frame
+		# Encode the frame once for each profile in use, all clients of a profile write the same buffer; without viewers
+		# only the frame reference is kept, unless a snapshot asked for a newer frame
+		if frame is None:
+			return
+		self._sequence += 1
+		self._width = numpy.size(frame, 1)
+		self._frame = (self._sequence, frame)
+		with self._lock:
+			if self._viewers == 0 and not self._snapshot:
+				self._pending = (self._sequence, frame)
+				return
+			profiles = self._profiles.keys() if self._viewers > 0 else []
+			self._pending = None
+			self._snapshot = False
+		variants = {}
+		for profile in profiles:
+			variants[profile] = self._encode(frame, profile)
+		self._data = (self._sequence, self._encode(frame), variants)
+		self._engine.notify()
+
+	# Method: _encode
+	def _encode(self, frame, profile=None):
+		# Resize (keeping the aspect ratio) and encode a frame into a complete multipart chunk
+		width, quality = profile if profile is not None else (None, StreamingServer.Quality)
+		if width is not None and width < numpy.size(frame, 1):
+			frame = cv2.resize(frame, (width, numpy.size(frame, 0) * width / numpy.size(frame, 1)), interpolation=cv2.INTER_AREA)
+		jpeg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tostring()
+		return "--jpgboundary\r\nContent-type: image/jpeg\r\nContent-length: " + str(len(jpeg)) + "\r\n\r\n" + jpeg + "\r\n"
+
+	# Method: acquire
+	def acquire(self, width=None, quality=None):
+		# Profile of a new client, the default stream is used when the profile is the default one or too many variants are encoded
+		width = max(16, width - width % 8) if width is not None and width > 0 else None
+		quality = min(95, max(10, quality)) if quality is not None else StreamingServer.Quality
+		profile = (width, quality)
+		if profile == (None, StreamingServer.Quality):
+			return None
+		with self._lock:
+			if profile not in self._profiles and len(self._profiles) >= StreamingServer.Variants:
+				return None
+			self._profiles[profile] = self._profiles.get(profile, 0) + 1
+		return profile
+
+	# Method: release
+	def release(self, profile):
+		if profile is None:
+			return
+		with self._lock:
+			self._profiles[profile] -= 1
+			if self._profiles[profile] <= 0:
+				del self._profiles[profile]
 
 	# Method: getSleep
 	def getSleep(self):
@@ -1173,6 +3718,303 @@ class StreamingServer(ThreadingMixIn, HTTPServer):
 	def setSleep(self, sleep):
 		self._sleep	= sleep
 
+	# Method: getTag
+	def getTag(self):
+		return self._tag
+
+	# Method: getWidth
+	def getWidth(self):
+		return self._width
+
+	# Method: getFrame
+	def getFrame(self):
+		return self._frame
+
+	# Method: getSnapshot
+	def getSnapshot(self):
+		# Sequence number and JPEG image of the last encoded frame (a view of the multipart chunk, so nothing is copied or
+		# encoded by the event loop); when there is a newer frame the camera thread is asked to encode its next frame
+		pending = self._pending
+		if pending is not None and pending[0] > self._data[0]:
+			self._snapshot = True
+		sequence, chunk = self._data[:2]
+		if chunk is None:
+			return sequence, None
+		start = chunk.index("\r\n\r\n") + 4
+		return sequence, buffer(chunk, start, len(chunk) - start - 2)
+
+	# Method: route
+	def route(self, path, query={}):
+		# The snapshot of the camera, any other path of the own listening port streams the camera
+		if path == "/snapshot.jpg":
+			return ("snapshot", self)
+		return ("stream", self)
+
+	# Method: connect
+	def connect(self):
+		# A new client watches the stream, the frame encoding starts with the next frame
+		with self._lock:
+			self._viewers += 1
+
+	# Method: disconnect
+	def disconnect(self):
+		with self._lock:
+			self._viewers = max(0, self._viewers - 1)
+
+	# Method: getClients
+	def getClients(self):
+		return self._viewers
+
+	# Method: getStats
+	def getStats(self):
+		return self._engine.getStats(self)
+
+	# Method: isClosed
+	def isClosed(self):
+		return self._closed
+
+	# Method: close
+	def close(self):
+		self._closed = True
+		self._engine.close(self)
+
+
+# Class: StreamingRouter
+class StreamingRouter:
+	# Constants
+	Pattern = re.compile(r"^/cam/(\d+)/(stream|snapshot\.jpg)$")
+	Mosaics = 4
+	# Shared instance, one endpoint for all cameras
+	_instance = None
+	_ilock = threading.Lock()
+
+	# Constructor
+	def __init__(self):
+		# Streams of the started cameras by camera identifier, and the listening address
+		self._streams = {}
+		# Mosaic streams by their configuration (cameras, size, layout and frame rate), shared by the clients asking the same mosaic
+		self._mosaics = {}
+		self._lock = threading.Lock()
+		self._engine = StreamingEngine.instance()
+		self.server_address = None
+
+	# Method: instance
+	@staticmethod
+	def instance():
+		with StreamingRouter._ilock:
+			if StreamingRouter._instance is None:
+				StreamingRouter._instance = StreamingRouter()
+			return StreamingRouter._instance
+
+	# Method: start
+	def start(self, address):
+		self.server_address = self._engine.listen(address, self).getsockname()
+
+	# Method: stop
+	def stop(self):
+		self._engine.close(self)
+		with self._lock:
+			mosaics = self._mosaics.values()
+			self._mosaics = {}
+		for mosaic in mosaics:
+			mosaic.stop()
+		self.server_address = None
+
+	# Method: isRunning
+	def isRunning(self):
+		return self.server_address is not None
+
+	# Method: attach
+	def attach(self, id, stream):
+		with self._lock:
+			self._streams[int(id)] = stream
+
+	# Method: detach
+	def detach(self, id, stream):
+		with self._lock:
+			if self._streams.get(int(id)) is stream:
+				del self._streams[int(id)]
+
+	# Method: getStream
+	def getStream(self, id):
+		with self._lock:
+			return self._streams.get(int(id))
+
+	# Method: mosaic
+	def mosaic(self, query):
+		# Mosaic of the selected cameras (all started cameras by default), an existing mosaic is shared when the configuration is the same
+		with self._lock:
+			cameras = [any2int(id) for id in query["cams"][0].split(",")] if "cams" in query else sorted(self._streams.keys())
+			cameras = tuple([id for id in cameras if id in self._streams])[:StreamingMosaic.Tiles]
+			if not cameras:
+				return None
+			size = StreamingMosaic.parse(query.get("size", [None])[0]) or StreamingMosaic.Size
+			layout = StreamingMosaic.parse(query.get("layout", [None])[0])
+			if layout is None or layout[0] * layout[1] < len(cameras):
+				layout = StreamingMosaic.layout(len(cameras))
+			rate = any2float(query.get("rate", [None])[0])
+			rate = min(StreamingMosaic.Framerate * 6, rate) if rate is not None and rate > 0 else StreamingMosaic.Framerate
+			key = (cameras, size, layout, rate)
+			mosaic = self._mosaics.get(key)
+			if mosaic is None:
+				if len(self._mosaics) >= StreamingRouter.Mosaics:
+					return None
+				mosaic = StreamingMosaic(self, cameras, size, layout, rate)
+				self._mosaics[key] = mosaic
+				mosaic.start()
+			mosaic.touch()
+			return mosaic
+
+	# Method: expire
+	def expire(self, mosaic):
+		# Remove a mosaic nobody watches, False when it was asked again in the meantime
+		with self._lock:
+			if not mosaic.isIdle():
+				return False
+			self._remove(mosaic)
+			return True
+
+	# Method: remove
+	def remove(self, mosaic):
+		with self._lock:
+			self._remove(mosaic)
+
+	# Method: _remove
+	def _remove(self, mosaic):
+		for key, value in self._mosaics.items():
+			if value is mosaic:
+				del self._mosaics[key]
+
+	# Method: route
+	def route(self, path, query={}):
+		# Routes: /cams (JSON list of cameras), /cam/<id>/stream, /cam/<id>/snapshot.jpg and /mosaic (e.g. /mosaic?cams=1,2,3,4&size=1280x720&layout=2x2&rate=5)
+		with self._lock:
+			streams = dict(self._streams)
+		if path.rstrip("/") == "/mosaic":
+			mosaic = self.mosaic(query)
+			return ("stream", mosaic.getStream()) if mosaic is not None else ("unavailable",)
+		if path.rstrip("/") == "/cams":
+			cameras = [{"id":id, "stream":"/cam/" + str(id) + "/stream", "snapshot":"/cam/" + str(id) + "/snapshot.jpg", "port":(stream.server_address[1] if stream.server_address is not None else None), "clients":stream.getStats()} for id, stream in sorted(streams.items())]
+			return ("content", "application/json", json.dumps(cameras))
+		match = StreamingRouter.Pattern.match(path)
+		if match is None or int(match.group(1)) not in streams:
+			return None
+		stream = streams[int(match.group(1))]
+		if match.group(2) == "stream":
+			return ("stream", stream)
+		return ("snapshot", stream)
+
+
+# Class: StreamingMosaic
+class StreamingMosaic(threading.Thread):
+	# Constants
+	Size = (1280, 720)
+	Framerate = 5
+	Tiles = 16
+	Idletime = 10
+
+	# Constructor
+	def __init__(self, router, cameras, size, layout, rate):
+		threading.Thread.__init__(self)
+		self.daemon = True
+		self._router = router
+		self._cameras = cameras
+		self._rate = rate
+		# Preallocated canvas (the tiles are drawn in place) and the tile areas (left, top, width, height) of the layout
+		width, height = size
+		columns, rows = layout
+		self._canvas = numpy.zeros((height, width, 3), dtype=numpy.uint8)
+		self._tiles = [((index % columns) * (width / columns), (index / columns) * (height / rows), width / columns, height / rows) for index in range(len(cameras))]
+		# For each tile the last drawn frame (stream and sequence number) and the preallocated buffer of the scaled frame
+		self._drawn = [None] * len(cameras)
+		self._scaled = [None] * len(cameras)
+		# The mosaic is encoded once and broadcast to all its clients by a stream without own listening port
+		self._stream = StreamingServer(None, sleep=0)
+		self._used = time.time()
+		self._running = True
+
+	# Method: parse
+	@staticmethod
+	def parse(value):
+		# Pair of positive numbers written as <a>x<b> (e.g. 1280x720 size or 2x2 layout)
+		values = [any2int(item) for item in value.lower().split("x")] if value is not None else []
+		if len(values) != 2 or None in values or min(values) <= 0:
+			return None
+		return min(values[0], 3840), min(values[1], 2160)
+
+	# Method: layout
+	@staticmethod
+	def layout(count):
+		# Grid as square as possible for a number of cameras
+		columns = int(numpy.ceil(numpy.sqrt(count)))
+		return columns, int(numpy.ceil(float(count) / columns))
+
+	# Method: getStream
+	def getStream(self):
+		return self._stream
+
+	# Method: touch
+	def touch(self):
+		self._used = time.time()
+
+	# Method: isIdle
+	def isIdle(self):
+		return self._stream.getClients() == 0 and time.time() - self._used > StreamingMosaic.Idletime
+
+	# Method: run
+	def run(self):
+		# Compose and broadcast the mosaic at a fixed rate while it has viewers, it stops when nobody watched it for a while
+		period = 1.0 / self._rate
+		deadline = time.time()
+		try:
+			while self._running:
+				if self._stream.getClients() > 0:
+					if self.compose():
+						self._stream.setData(self._canvas)
+				elif self.isIdle() and self._router.expire(self):
+					break
+				deadline = max(deadline + period, time.time())
+				time.sleep(max(0, deadline - time.time()))
+		finally:
+			# A failed mosaic releases its slot, the next client asking for it starts a new one
+			self._stream.close()
+			self._router.remove(self)
+
+	# Method: compose
+	def compose(self):
+		# Draw the downscaled latest frame of each camera in its tile (keeping the aspect ratio), only the tiles of the
+		# cameras having a new frame are drawn again; False when nothing has changed
+		changed = False
+		for index, id in enumerate(self._cameras):
+			left, top, width, height = self._tiles[index]
+			stream = self._router.getStream(id)
+			sequence, frame = stream.getFrame() if stream is not None else (None, None)
+			if frame is None:
+				if self._drawn[index] is not None:
+					self._canvas[top:top + height, left:left + width] = 0
+					self._drawn[index] = None
+					changed = True
+				continue
+			if self._drawn[index] == (stream, sequence):
+				continue
+			scale = min(float(width) / numpy.size(frame, 1), float(height) / numpy.size(frame, 0))
+			size = (max(1, int(numpy.size(frame, 1) * scale)), max(1, int(numpy.size(frame, 0) * scale)))
+			scaled = self._scaled[index]
+			if scaled is None or scaled.shape[:2] != (size[1], size[0]):
+				scaled = self._scaled[index] = numpy.empty((size[1], size[0], 3), dtype=numpy.uint8)
+				self._canvas[top:top + height, left:left + width] = 0
+			cv2.resize(frame, size, dst=scaled, interpolation=cv2.INTER_AREA)
+			left += (width - size[0]) / 2
+			top += (height - size[1]) / 2
+			self._canvas[top:top + size[1], left:left + size[0]] = scaled
+			self._drawn[index] = (stream, sequence)
+			changed = True
+		return changed
+
+	# Method: stop
+	def stop(self):
+		self._running = False
+
 
 # Class: PiCamServerHandler
 class PiCamServerHandler(BaseRequestHandler):
@@ -1253,6 +4095,16 @@ class PiCamServerHandler(BaseRequestHandler):
 				else:
 					raise RuntimeError("Invalid property action: " + any2str(data.action))
 				answer = self.server.runPropertySet(data.target, camprop, camdata)
+			# Evaluate recordings actions
+			elif data is not None and data.subject == StateData.Subjects[3]:
+				if data.action == StateData.Actions[11]:
+					answer = self.server.runRecordingsList(data.target, data.property)
+				elif data.action == StateData.Actions[12]:
+					answer = self.server.runRecordingsClip(data.target, data.property)
+				elif data.action == StateData.Actions[13]:
+					answer = self.server.runRecordingsPreview(data.target, data.property)
+				else:
+					raise RuntimeError("Invalid recordings action: " + any2str(data.action))
 			else:
 				answer = '{"action":"unknown", "subject":"unknown", "achieved":false, "message":"Command ' + str(data) + ' is not implemented or is unknown"}'
 				self._server.log("Command " + str(data) + " is not implemented or is unknown", "ERROR")
@@ -1290,6 +4142,12 @@ class PiCamServer(ThreadingMixIn, TCPServer):
 		self._running = True
 		self.log("======================================")
 		self.log(__project__ + " " + __module__ + " Server has been initialized")
+		# Shared streaming endpoint for all cameras (on the port before server port)
+		try:
+			StreamingRouter.instance().start((Camera.StreamInterface, self.server_address[1] - 1))
+			self.log("Shared streaming endpoint started on " + str(StreamingRouter.instance().server_address))
+		except socket.error as sockerr:
+			self.log(["Shared streaming endpoint initialization failed:", sockerr], "WARN")
 
 	# Method _answer
 	def _answer(self, action, subject, achieved, message=None, result=None):
@@ -1335,6 +4193,7 @@ class PiCamServer(ThreadingMixIn, TCPServer):
 	# Method: shutdown
 	def shutdown(self):
 		self._running = False
+		StreamingRouter.instance().stop()
 		TCPServer.shutdown(self)
 		self.server_close()
 
@@ -1404,12 +4263,30 @@ class PiCamServer(ThreadingMixIn, TCPServer):
 				if camera.isCameraRecordingOn():
 					result += ', "' + StateData.Properties[9] + '":"' + any2str(camera.getRecordingFormat()) + '"'
 					result += ', "' + StateData.Properties[18] + '":"' + any2str(camera.getRecordingEncoder()) + '"'
+					if camera.getRecordingEncoder() == 'auto':
+						result += ', "RecordingFourcc":"' + any2str(camera.getRecordingFourcc()) + '"'
 					result += ', "' + StateData.Properties[11] + '":"' + any2str(camera.getRecordingLocation()) + '"'
+					result += ', "' + StateData.Properties[19] + '":' + any2str(camera.getRecordingDistance())
+					result += ', "RecordingSavedSize":' + any2str(camera.getRecordingSavedSize())
+					result += ', "' + StateData.Properties[20] + '":' + any2str(camera.getRecordingQuota())
+					result += ', "' + StateData.Properties[21] + '":"' + ('default' if camera.getRecordingArchive() is None else any2str(camera.getRecordingArchive())) + '"'
+					result += ', "' + StateData.Properties[22] + '":"' + ('default' if camera.getRecordingAging() is None else any2str(camera.getRecordingAging())) + '"'
+					result += ', "' + StateData.Properties[23] + '":"' + ('default' if camera.getRecordingStage() is None else any2str(camera.getRecordingStage())) + '"'
+					result += ', "' + StateData.Properties[24] + '":' + any2str(camera.getRecordingStageSize())
+					if camera.getRecordingStage() is not None:
+						result += ', "RecordingStageThroughput":' + any2str(camera.getRecordingStageThroughput())
+						result += ', "RecordingStageLag":' + any2str(camera.getRecordingStageLag())
+					result += ', "' + StateData.Properties[25] + '":' + any2str(camera.getRecordingIdletime())
+					result += ', "' + StateData.Properties[26] + '":' + any2str(camera.getRecordingTimelapse())
+					result += ', "' + StateData.Properties[27] + '":' + any2str(camera.getRecordingSnapshots())
+					result += ', "' + StateData.Properties[28] + '":' + any2str(camera.getRecordingKeyframe())
+					result += ', "' + StateData.Properties[29] + '":"' + any2str(camera.getRecordingBudget()) + '"'
 				# CameraStreaming
 				result += ', "' + StateData.Properties[2] + '":"' + ('On' if camera.isCameraStreamingOn() else 'Off') + '"'
 				if camera.isCameraStreamingOn():
 					result += ', "' + StateData.Properties[12] + '":' + any2str(camera.getStreamingPort())
 					result += ', "' + StateData.Properties[13] + '":' + any2str(camera.getStreamingSleep())
+					result += ', "StreamingClients":' + any2str(camera.getStreamingClients())
 				result += '}'
 				index += 1
 			result += ']'
@@ -1582,6 +4459,50 @@ class PiCamServer(ThreadingMixIn, TCPServer):
 					elif camprop.lower() == StateData.Properties[13].lower():
 						camdata = any2float(camdata, error=True, none=False)
 						camera.setStreamingSleep(camdata)
+					# Evaluate RecordingDistance property
+					elif camprop.lower() == StateData.Properties[19].lower():
+						camdata = any2int(camdata, error=True, none=False)
+						camera.setRecordingDistance(camdata)
+					# Evaluate RecordingQuota property
+					elif camprop.lower() == StateData.Properties[20].lower():
+						camdata = any2int(camdata, error=True, none=False)
+						camera.setRecordingQuota(camdata)
+					# Evaluate RecordingArchive property
+					elif camprop.lower() == StateData.Properties[21].lower():
+						camdata = any2str(camdata, error=True, none=False)
+						camera.setRecordingArchive(camdata)
+					# Evaluate RecordingAging property
+					elif camprop.lower() == StateData.Properties[22].lower():
+						camdata = any2str(camdata, error=True, none=False)
+						camera.setRecordingAging(camdata)
+					# Evaluate RecordingStage property
+					elif camprop.lower() == StateData.Properties[23].lower():
+						camdata = any2str(camdata, error=True, none=False)
+						camera.setRecordingStage(camdata)
+					# Evaluate RecordingStageSize property
+					elif camprop.lower() == StateData.Properties[24].lower():
+						camdata = any2int(camdata, error=True, none=False)
+						camera.setRecordingStageSize(camdata)
+					# Evaluate RecordingIdletime property
+					elif camprop.lower() == StateData.Properties[25].lower():
+						camdata = any2int(camdata, error=True, none=False)
+						camera.setRecordingIdletime(camdata)
+					# Evaluate RecordingTimelapse property
+					elif camprop.lower() == StateData.Properties[26].lower():
+						camdata = any2int(camdata, error=True, none=False)
+						camera.setRecordingTimelapse(camdata)
+					# Evaluate RecordingSnapshots property
+					elif camprop.lower() == StateData.Properties[27].lower():
+						camdata = any2int(camdata, error=True, none=False)
+						camera.setRecordingSnapshots(camdata)
+					# Evaluate RecordingKeyframe property
+					elif camprop.lower() == StateData.Properties[28].lower():
+						camdata = any2int(camdata, error=True, none=False)
+						camera.setRecordingKeyframe(camdata)
+					# Evaluate RecordingBudget property
+					elif camprop.lower() == StateData.Properties[29].lower():
+						camdata = any2str(camdata, error=True, none=False)
+						camera.setRecordingBudget(camdata)
 					else:
 						achieved = False
 						lvl = 'WARN'
@@ -1608,6 +4529,99 @@ class PiCamServer(ThreadingMixIn, TCPServer):
 		# Aggregate JSON output
 		return self._answer(StateData.Actions[4], StateData.Subjects[2], achieved, msg, result)
 
+	# Method: runRecordingsList
+	def runRecordingsList(self, id, period=None):
+		achieved = True
+		result = None
+		lvl = 'INFO'
+		msg = None
+		# Call initiation output
+		self.log("Calling [Recordings List]", 'DEBUG')
+		try:
+			camera = int(filter(str.isdigit, str(id))) if id is not None else None
+			start, end = RecordingCatalog.period(period)
+			records = RecordingCatalog.instance().find(camera, start, end)
+			result = {"recordings":[{"camera":record[0], "path":record[1], "start":time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(record[2])),
+									 "end":time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(record[3])), "frames":record[4],
+									 "size":record[5], "format":record[6], "motion":record[7] > 0} for record in records]}
+			msg = "Found " + str(len(records)) + " recordings" + ("" if camera is None else " of camera #" + str(camera))
+		except BaseException as stderr:
+			achieved = False
+			lvl, msg = tomsg(["Error listing recordings:", stderr], logger=self._logger)
+		# Log execution output
+		self.log(msg, lvl)
+		# Aggregate JSON output
+		return self._answer(StateData.Actions[11], StateData.Subjects[3], achieved, msg, result)
+
+	# Method: runRecordingsPreview
+	def runRecordingsPreview(self, id, period=None):
+		achieved = True
+		result = None
+		lvl = 'INFO'
+		msg = None
+		# Call initiation output
+		self.log("Calling [Recordings Preview]", 'DEBUG')
+		try:
+			camera = int(filter(str.isdigit, str(id))) if id is not None else None
+			start, end = RecordingCatalog.period(period)
+			records = RecordingCatalog.instance().find(camera, start, end)
+			thumbnails = []
+			strips = []
+			for record in records:
+				# Thumbnail of the segment file and strip of its hour (cam##-YYYYMMDD-HH.strip.jpg from its day folder)
+				if os.path.isfile(record[1] + PreviewBuilder.Thumbnail) and not [item for item in thumbnails if item["path"] == record[1]]:
+					thumbnails.append({"camera":record[0], "start":time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(record[2])), "path":record[1], "thumbnail":record[1] + PreviewBuilder.Thumbnail})
+				match = re.match(r"^(.*/\d{6}/\d{2})/(?:\d{2}/)?(cam\d+-\d{8}-\d{2})", record[1])
+				if match is not None and os.path.isfile(match.group(1) + "/" + match.group(2) + PreviewBuilder.Strip) and strips.count(match.group(1) + "/" + match.group(2) + PreviewBuilder.Strip) == 0:
+					strips.append(match.group(1) + "/" + match.group(2) + PreviewBuilder.Strip)
+			result = {"thumbnails":thumbnails, "strips":strips}
+			msg = "Found " + str(len(thumbnails)) + " thumbnails and " + str(len(strips)) + " hourly strips" + ("" if camera is None else " of camera #" + str(camera))
+		except BaseException as stderr:
+			achieved = False
+			lvl, msg = tomsg(["Error listing recordings previews:", stderr], logger=self._logger)
+		# Log execution output
+		self.log(msg, lvl)
+		# Aggregate JSON output
+		return self._answer(StateData.Actions[13], StateData.Subjects[3], achieved, msg, result)
+
+	# Method: runRecordingsClip
+	def runRecordingsClip(self, id, period):
+		achieved = True
+		result = None
+		lvl = 'INFO'
+		msg = None
+		# Call initiation output
+		self.log("Calling [Recordings Clip]", 'DEBUG')
+		try:
+			camera = int(filter(str.isdigit, str(id)))
+			start, end = RecordingCatalog.period(period)
+			start = start if start is not None else 0
+			end = end if end is not None else time.time()
+			records = RecordingCatalog.instance().find(camera, start, end, -1)
+			if records:
+				# The clip is stored in 'clips' folder of the recording location of the first segment (not managed by retention and aging)
+				match = re.match(r"^(.*)/\d{6}/\d{2}/", records[0][1])
+				target = (match.group(1) if match is not None else os.path.dirname(records[0][1])) + "/clips/clip-cam" + str(camera).rjust(2, '0')
+				target += time.strftime("-%Y%m%d-%H%M%S", time.localtime(max(start, records[0][2]))) + time.strftime("-%Y%m%d-%H%M%S", time.localtime(min(end, time.time())))
+				if not os.path.isdir(os.path.dirname(target)):
+					os.makedirs(os.path.dirname(target))
+				# The extraction should not slow down the cameras that are recording
+				lowpriority()
+				frames, size = cliptask(records, start, end, target)
+				result = {"clip":target + FrameLog.Data, "frames":frames, "size":size / 1024}
+				msg = "Clip " + target + FrameLog.Data + " has been created from " + str(len(records)) + " segments having " + str(frames) + " frames (" + str(size / 1024) + " KB)"
+			else:
+				achieved = False
+				lvl = 'WARN'
+				msg = "No recordings of camera #" + str(camera) + " found for the specified time range"
+		except BaseException as stderr:
+			achieved = False
+			lvl, msg = tomsg(["Error extracting recordings clip:", stderr], logger=self._logger)
+		# Log execution output
+		self.log(msg, lvl)
+		# Aggregate JSON output
+		return self._answer(StateData.Actions[12], StateData.Subjects[3], achieved, msg, result)
+
 	# Method: runServerLoad
 	def runServerLoad(self, path=None):
 		achieved = True
@@ -1764,6 +4778,94 @@ class PiCamServer(ThreadingMixIn, TCPServer):
 									result["set-properties"].append(jsonout["result"]["property"])
 							else:
 								msg += ('. ' + str(jsonout["message"]))
+						# RecordingDistance
+						if service.get("RecordingDistance"):
+							jsonout = json.loads(self.runPropertySet(CameraId, "RecordingDistance", service["RecordingDistance"]))
+							if jsonout["achieved"]:
+								if result["set-properties"].count(jsonout["result"]["property"]) == 0:
+									result["set-properties"].append(jsonout["result"]["property"])
+							else:
+								msg += ('. ' + str(jsonout["message"]))
+						# RecordingQuota
+						if service.get("RecordingQuota"):
+							jsonout = json.loads(self.runPropertySet(CameraId, "RecordingQuota", service["RecordingQuota"]))
+							if jsonout["achieved"]:
+								if result["set-properties"].count(jsonout["result"]["property"]) == 0:
+									result["set-properties"].append(jsonout["result"]["property"])
+							else:
+								msg += ('. ' + str(jsonout["message"]))
+						# RecordingArchive
+						if service.get("RecordingArchive"):
+							jsonout = json.loads(self.runPropertySet(CameraId, "RecordingArchive", service["RecordingArchive"]))
+							if jsonout["achieved"]:
+								if result["set-properties"].count(jsonout["result"]["property"]) == 0:
+									result["set-properties"].append(jsonout["result"]["property"])
+							else:
+								msg += ('. ' + str(jsonout["message"]))
+						# RecordingAging
+						if service.get("RecordingAging"):
+							jsonout = json.loads(self.runPropertySet(CameraId, "RecordingAging", service["RecordingAging"]))
+							if jsonout["achieved"]:
+								if result["set-properties"].count(jsonout["result"]["property"]) == 0:
+									result["set-properties"].append(jsonout["result"]["property"])
+							else:
+								msg += ('. ' + str(jsonout["message"]))
+						# RecordingStage
+						if service.get("RecordingStage"):
+							jsonout = json.loads(self.runPropertySet(CameraId, "RecordingStage", service["RecordingStage"]))
+							if jsonout["achieved"]:
+								if result["set-properties"].count(jsonout["result"]["property"]) == 0:
+									result["set-properties"].append(jsonout["result"]["property"])
+							else:
+								msg += ('. ' + str(jsonout["message"]))
+						# RecordingStageSize
+						if service.get("RecordingStageSize"):
+							jsonout = json.loads(self.runPropertySet(CameraId, "RecordingStageSize", service["RecordingStageSize"]))
+							if jsonout["achieved"]:
+								if result["set-properties"].count(jsonout["result"]["property"]) == 0:
+									result["set-properties"].append(jsonout["result"]["property"])
+							else:
+								msg += ('. ' + str(jsonout["message"]))
+						# RecordingIdletime
+						if service.get("RecordingIdletime"):
+							jsonout = json.loads(self.runPropertySet(CameraId, "RecordingIdletime", service["RecordingIdletime"]))
+							if jsonout["achieved"]:
+								if result["set-properties"].count(jsonout["result"]["property"]) == 0:
+									result["set-properties"].append(jsonout["result"]["property"])
+							else:
+								msg += ('. ' + str(jsonout["message"]))
+						# RecordingTimelapse
+						if service.get("RecordingTimelapse"):
+							jsonout = json.loads(self.runPropertySet(CameraId, "RecordingTimelapse", service["RecordingTimelapse"]))
+							if jsonout["achieved"]:
+								if result["set-properties"].count(jsonout["result"]["property"]) == 0:
+									result["set-properties"].append(jsonout["result"]["property"])
+							else:
+								msg += ('. ' + str(jsonout["message"]))
+						# RecordingSnapshots
+						if service.get("RecordingSnapshots"):
+							jsonout = json.loads(self.runPropertySet(CameraId, "RecordingSnapshots", service["RecordingSnapshots"]))
+							if jsonout["achieved"]:
+								if result["set-properties"].count(jsonout["result"]["property"]) == 0:
+									result["set-properties"].append(jsonout["result"]["property"])
+							else:
+								msg += ('. ' + str(jsonout["message"]))
+						# RecordingKeyframe
+						if service.get("RecordingKeyframe"):
+							jsonout = json.loads(self.runPropertySet(CameraId, "RecordingKeyframe", service["RecordingKeyframe"]))
+							if jsonout["achieved"]:
+								if result["set-properties"].count(jsonout["result"]["property"]) == 0:
+									result["set-properties"].append(jsonout["result"]["property"])
+							else:
+								msg += ('. ' + str(jsonout["message"]))
+						# RecordingBudget
+						if service.get("RecordingBudget"):
+							jsonout = json.loads(self.runPropertySet(CameraId, "RecordingBudget", service["RecordingBudget"]))
+							if jsonout["achieved"]:
+								if result["set-properties"].count(jsonout["result"]["property"]) == 0:
+									result["set-properties"].append(jsonout["result"]["property"])
+							else:
+								msg += ('. ' + str(jsonout["message"]))
 						# Function: CameraMotion
 						if service.get("CameraMotion") and any2bool(service["CameraMotion"]):
 							jsonout = json.loads(self.runPropertySet(CameraId, "CameraMotion", service["CameraMotion"]))
@@ -1972,6 +5074,10 @@ class PiCamClient:
 							self.log(self._echo(jsonanswer), type="INFO")
 						elif jsonanswer["action"] == StateData.Actions[7] and jsonanswer["subject"] == StateData.Subjects[0]:
 							self.log(self._status(jsonanswer), type="INFO")
+						elif jsonanswer["action"] == StateData.Actions[11] and jsonanswer["subject"] == StateData.Subjects[3] and jsonanswer["achieved"]:
+							self.log(self._recordings(jsonanswer), type="INFO")
+						elif jsonanswer["action"] == StateData.Actions[13] and jsonanswer["subject"] == StateData.Subjects[3] and jsonanswer["achieved"]:
+							self.log(self._previews(jsonanswer), type="INFO")
 						else:
 							if jsonanswer.get("message") is not None:
 								message = jsonanswer["message"]
@@ -2049,6 +5155,29 @@ class PiCamClient:
 		else:
 			return ""
 
+	# Method: recordings
+	def _recordings(self, answer):
+		if answer is not None and answer.get("result") is not None:
+			text = answer["message"]
+			for record in answer["result"]["recordings"]:
+				text += '\n\t> #' + any2str(record["camera"]) + ' | ' + record["start"] + ' - ' + record["end"][11:] + ' | ' + any2str(record["format"])
+				text += ' | ' + any2str(record["frames"]) + ' frames | ' + any2str(record["size"] / 1024) + ' KB' + (' | motion' if record["motion"] else '') + ' | ' + record["path"]
+			return text
+		else:
+			return ""
+
+	# Method: previews
+	def _previews(self, answer):
+		if answer is not None and answer.get("result") is not None:
+			text = answer["message"]
+			for strip in answer["result"]["strips"]:
+				text += '\n\t> strip | ' + strip
+			for item in answer["result"]["thumbnails"]:
+				text += '\n\t> #' + any2str(item["camera"]) + ' | ' + item["start"] + ' | ' + item["thumbnail"]
+			return text
+		else:
+			return ""
+
 	# Method: status
 	def _status(self, answer):
 		if answer is not None and answer["result"] is not None:
@@ -2068,6 +5197,8 @@ class PiCamClient:
 					text += '\n\t\t| CameraStreaming: On'
 					text += '\n\t\t\t|| StreamingPort: ' + any2str(service["StreamingPort"])
 					text += '\n\t\t\t|| StreamingSleeptime: ' + any2str(service["StreamingSleeptime"])
+					if service.get("StreamingClients") is not None:
+						text += '\n\t\t\t|| StreamingClients: ' + any2str(service.get("StreamingClients"))
 				elif service.get("CameraStreaming") and not any2bool(service["CameraStreaming"]):
 					text += '\n\t\t| CameraStreaming: Off'
 				# Motion Detection
@@ -2083,7 +5214,24 @@ class PiCamClient:
 					text += '\n\t\t| CameraRecording: On'
 					text += '\n\t\t\t|| RecordingFormat: ' + any2str(service["RecordingFormat"])
 					text += '\n\t\t\t|| RecordingEncoder: ' + any2str(service["RecordingEncoder"])
+					if service.get("RecordingFourcc") is not None:
+						text += '\n\t\t\t|| RecordingFourcc: ' + any2str(service.get("RecordingFourcc"))
 					text += '\n\t\t\t|| RecordingLocation: ' + any2str(service["RecordingLocation"])
+					text += '\n\t\t\t|| RecordingDistance: ' + any2str(service.get("RecordingDistance"))
+					text += '\n\t\t\t|| RecordingSavedSize: ' + any2str(service.get("RecordingSavedSize")) + ' KB'
+					text += '\n\t\t\t|| RecordingQuota: ' + any2str(service.get("RecordingQuota"))
+					text += '\n\t\t\t|| RecordingArchive: ' + any2str(service.get("RecordingArchive"))
+					text += '\n\t\t\t|| RecordingAging: ' + any2str(service.get("RecordingAging"))
+					text += '\n\t\t\t|| RecordingStage: ' + any2str(service.get("RecordingStage"))
+					text += '\n\t\t\t|| RecordingStageSize: ' + any2str(service.get("RecordingStageSize"))
+					if service.get("RecordingStageThroughput") is not None:
+						text += '\n\t\t\t|| RecordingStageThroughput: ' + any2str(service.get("RecordingStageThroughput")) + ' KB/s'
+						text += '\n\t\t\t|| RecordingStageLag: ' + any2str(service.get("RecordingStageLag")) + ' s'
+					text += '\n\t\t\t|| RecordingIdletime: ' + any2str(service.get("RecordingIdletime"))
+					text += '\n\t\t\t|| RecordingTimelapse: ' + any2str(service.get("RecordingTimelapse"))
+					text += '\n\t\t\t|| RecordingSnapshots: ' + any2str(service.get("RecordingSnapshots"))
+					text += '\n\t\t\t|| RecordingKeyframe: ' + any2str(service.get("RecordingKeyframe"))
+					text += '\n\t\t\t|| RecordingBudget: ' + any2str(service.get("RecordingBudget"))
 				elif service.get("CameraRecording") and not any2bool(service["CameraRecording"]):
 					text += '\n\t\t| CameraRecording: Off'
 			return text
@@ -2171,6 +5319,39 @@ class PiCamClient:
 							# StreamingSleeptime
 							if service.get("StreamingSleeptime") and service["StreamingSleeptime"] != "default":
 								content.append("set property StreamingSleeptime=" + any2str(service["StreamingSleeptime"]) + CameraId)
+							# RecordingDistance
+							if service.get("RecordingDistance") and service["RecordingDistance"] != "default":
+								content.append("set property RecordingDistance=" + any2str(service["RecordingDistance"]) + CameraId)
+							# RecordingQuota
+							if service.get("RecordingQuota") and service["RecordingQuota"] != "default":
+								content.append("set property RecordingQuota=" + any2str(service["RecordingQuota"]) + CameraId)
+							# RecordingArchive
+							if service.get("RecordingArchive") and service["RecordingArchive"] != "default":
+								content.append("set property RecordingArchive=" + any2str(service["RecordingArchive"]) + CameraId)
+							# RecordingAging
+							if service.get("RecordingAging") and service["RecordingAging"] != "default":
+								content.append("set property RecordingAging=" + any2str(service["RecordingAging"]) + CameraId)
+							# RecordingStage
+							if service.get("RecordingStage") and service["RecordingStage"] != "default":
+								content.append("set property RecordingStage=" + any2str(service["RecordingStage"]) + CameraId)
+							# RecordingStageSize
+							if service.get("RecordingStageSize") and service["RecordingStageSize"] != "default":
+								content.append("set property RecordingStageSize=" + any2str(service["RecordingStageSize"]) + CameraId)
+							# RecordingIdletime
+							if service.get("RecordingIdletime") and service["RecordingIdletime"] != "default":
+								content.append("set property RecordingIdletime=" + any2str(service["RecordingIdletime"]) + CameraId)
+							# RecordingTimelapse
+							if service.get("RecordingTimelapse") and service["RecordingTimelapse"] != "default":
+								content.append("set property RecordingTimelapse=" + any2str(service["RecordingTimelapse"]) + CameraId)
+							# RecordingSnapshots
+							if service.get("RecordingSnapshots") and service["RecordingSnapshots"] != "default":
+								content.append("set property RecordingSnapshots=" + any2str(service["RecordingSnapshots"]) + CameraId)
+							# RecordingKeyframe
+							if service.get("RecordingKeyframe") and service["RecordingKeyframe"] != "default":
+								content.append("set property RecordingKeyframe=" + any2str(service["RecordingKeyframe"]) + CameraId)
+							# RecordingBudget
+							if service.get("RecordingBudget") and service["RecordingBudget"] != "default":
+								content.append("set property RecordingBudget=" + any2str(service["RecordingBudget"]) + CameraId)
 							# Function: CameraMotion
 							if service.get("CameraMotion") and any2bool(service["CameraMotion"]):
 								content.append("enable property CameraMotion" + CameraId)
@@ -2203,12 +5384,14 @@ class PiCamClient:
 
 # Class: CmdData
 class StateData:
-	Actions = ['init', 'shutdown', 'start', 'stop', 'set', 'enable', 'disable', 'status', 'echo', 'load', 'save']
-	Subjects = ['server', 'service', 'property']
+	Actions = ['init', 'shutdown', 'start', 'stop', 'set', 'enable', 'disable', 'status', 'echo', 'load', 'save', 'list', 'clip', 'preview']
+	Subjects = ['server', 'service', 'property', 'recordings']
 	Properties = ['CameraId', 'CameraStatus', 'CameraStreaming', 'CameraMotion', 'CameraResolution', 'CameraFramerate',
 				  'CameraSleeptime', 'MotionContour', 'CameraRecording', 'RecordingFormat', 'MotionThreshold',
 				  'RecordingLocation', 'StreamingPort', 'StreamingSleeptime', 'MotionSympathy', 'CameraBrightness',
-				  'CameraSaturation', 'CameraContrast', 'RecordingEncoder']
+				  'CameraSaturation', 'CameraContrast', 'RecordingEncoder', 'RecordingDistance', 'RecordingQuota',
+				  'RecordingArchive', 'RecordingAging', 'RecordingStage', 'RecordingStageSize', 'RecordingIdletime',
+				  'RecordingTimelapse', 'RecordingSnapshots', 'RecordingKeyframe', 'RecordingBudget']
 	Articles = ['@', 'at', 'on', 'in', 'to', 'from']
 
 	# Constructor
@@ -2234,6 +5417,10 @@ class StateData:
 			raise RuntimeError("Invalid subject of start/stop action: " + any2str(self.subject))
 		elif (self.action == StateData.Actions[4] or self.action == StateData.Actions[5] or self.action == StateData.Actions[6]) and self.subject != StateData.Subjects[2]:
 			raise RuntimeError("Invalid action for property action: " + any2str(self.action))
+		elif (self.action == StateData.Actions[11] or self.action == StateData.Actions[12] or self.action == StateData.Actions[13]) != (self.subject == StateData.Subjects[3]):
+			raise RuntimeError("Invalid subject of list/clip/preview action: " + any2str(self.subject))
+		elif self.action == StateData.Actions[12] and (self.target is None or not self.property):
+			raise RuntimeError("Clip action needs a time range and a target camera")
 		elif (self.subject == StateData.Subjects[1] or self.subject == StateData.Subjects[2]) and self.target is None:
 			raise RuntimeError("Unknown target for the specified subject and action: " + any2str(self.subject) + "/" + any2str(self.action))
 		elif self.action is None or self.action == '':
@@ -2251,7 +5438,7 @@ class StateData:
 			elif data[0].strip() in self.Subjects:
 				self.subject = data[0].strip()
 				del data[0]
-				if self.subject == self.Subjects[2]:
+				if self.subject == self.Subjects[2] or self.subject == self.Subjects[3]:
 					index = None
 					useprep = list(set(self.Articles) & set(data))
 					useaction = list(set(self.Actions) & set(data))
@@ -2265,7 +5452,7 @@ class StateData:
 					else:
 						self.property = ' '.join(data).strip()
 						del data[:]
-					if not self.property.split('=')[0].strip() in self.Properties:
+					if self.subject == self.Subjects[2] and not self.property.split('=')[0].strip() in self.Properties:
 						raise RuntimeError("Invalid property: " + self.property.split('=')[0].strip())
 				self._parse(data)
 			elif data[0].strip() in self.Articles:
@@ -2284,7 +5471,7 @@ class StateData:
 		outcmd = None
 		if self.action is not None and self.subject is not None:
 			outcmd = self.action + " " + self.subject
-			if self.subject == self.Subjects[2]:
+			if self.subject == self.Subjects[2] or (self.subject == self.Subjects[3] and self.property):
 				outcmd += " " + self.property
 		if self.target is not None:
 			outcmd += " on " + self.target
@@ -2353,6 +5540,10 @@ def usage():
    = run client to start on server camera #1. The client will connect to server using default port
  > picam enable recording on c0
    = run client (using default hostname and port) aggregating command from all input parameters
+ > picam list recordings 20261019-10..20261019-11 on c1
+   = run client to list the recordings of camera #1 between 10:00 and 11:59:59 from the recordings catalog
+ > picam clip recordings 20261019-101500..20261019-101630 on c1
+   = run client to extract in a frame log clip the recordings of camera #1 between 10:15:00 and 10:16:30
  > picam -c "set property CameraResolution=1280,720 on c1" -h "192.168.0.100" -p 6400
  > picam --command="set property CameraResolution=1280,720 on c1" --host="127.0.0.1" --port=6400
    = run client that will send the command described by a specific option to a dedicated server
@@ -2486,6 +5677,139 @@ def procexec(cmd):
 	return _status, _output
 
 
+# Function: lowpriority
+def lowpriority():
+	# Lower CPU and I/O priorities of the calling thread (Linux applies them per thread when the target is 0)
+	try:
+		os.nice(10)
+		sysno = {"x86_64":251, "i386":289, "i686":289, "armv6l":314, "armv7l":314, "aarch64":30}.get(platform.machine())
+		if sysno is not None:
+			# ioprio_set(IOPRIO_WHO_PROCESS, 0, IOPRIO_CLASS_IDLE << IOPRIO_CLASS_SHIFT)
+			ctypes.CDLL(None).syscall(sysno, 1, 0, 3 << 13)
+	except BaseException:
+		pass
+
+
+# Function: cliptask
+def cliptask(records, start, end, target):
+	# Copy the frames of a time range from the recorded segments into a frame log clip, only the video and region of interest frames are re-encoded
+	clip = FrameLog(target)
+	try:
+		paths = set()
+		for record in records:
+			path, started, ended, frames = record[1], record[2], record[3], record[4]
+			if path in paths or not os.path.isfile(path):
+				continue
+			paths.add(path)
+			if path.endswith(FrameLog.Data):
+				# The frame log index locates the first frame, then the encoded frames are copied as they are
+				reader = FrameLogReader(path)
+				try:
+					index = reader.find(start)
+					while index < len(reader) and reader.getTimestamp(index) <= end:
+						clip.append(reader.getTimestamp(index), reader.getData(index))
+						index += 1
+				finally:
+					reader.close()
+			elif path.endswith(RoiLog.Data):
+				# The region of interest log frames are reconstructed (last keyframe and its crops) and encoded as full frames
+				reader = RoiLogReader(path)
+				try:
+					index = reader.find(start)
+					while index < len(reader) and reader.getTimestamp(index) <= end:
+						frame = reader.getFrame(index)
+						if frame is not None:
+							clip.append(reader.getTimestamp(index), cv2.imencode(FrameLog.Encoding, frame)[1].tostring())
+						index += 1
+				finally:
+					reader.close()
+			elif path.endswith(".avi"):
+				# The frame timestamps are interpolated between segment start and end; decoding starts from the first needed frame
+				step = (ended - started) / (frames - 1) if frames > 1 else 0
+				index = int(numpy.ceil((start - started) / step)) if step > 0 and start > started else 0
+				capture = cv2.VideoCapture(path)
+				try:
+					if index > 0:
+						capture.set(cv2.CAP_PROP_POS_FRAMES, index)
+					while index < frames and started + index * step <= end:
+						ok, frame = capture.read()
+						if not ok:
+							break
+						clip.append(started + index * step, cv2.imencode(FrameLog.Encoding, frame)[1].tostring())
+						index += 1
+				finally:
+					capture.release()
+			elif start <= started <= end:
+				# Still images are copied as they are (frame log readers decode any image format)
+				file = open(path, 'rb')
+				try:
+					clip.append(started, file.read())
+				finally:
+					file.close()
+	finally:
+		clip.close()
+	return clip.getFramesNumber(), clip.getDataSize()
+
+
+# Function: agingtask
+def agingtask(sources, target, scale, step, framerate, encoder):
+	# Re-encode images or video files in one video file having lower resolution and/or frame rate (it runs in process pool)
+	writer = None
+	temp = target[:-4] + "-tmp.avi"
+	# Never replace an existing target, it holds frames whose sources have been already removed
+	if os.path.exists(target):
+		return 0
+	try:
+		for source in sources:
+			if source.endswith(FrameLog.Index):
+				continue
+			if source.endswith(".avi"):
+				capture = cv2.VideoCapture(source)
+				fps = capture.get(cv2.CAP_PROP_FPS)
+				if fps > 0:
+					framerate = max(1, fps / step)
+			elif source.endswith(FrameLog.Data):
+				capture = FrameLogReader(source)
+			else:
+				capture = None
+			index = 0
+			while True:
+				if isinstance(capture, FrameLogReader):
+					if index >= len(capture):
+						break
+					frame = capture.getFrame(index)
+				elif capture is not None:
+					ok, frame = capture.read()
+					if not ok:
+						break
+				else:
+					frame = cv2.imread(source)
+				if frame is not None and index % step == 0:
+					if scale != 1.0:
+						frame = cv2.resize(frame, (int(numpy.size(frame, 1) * scale), int(numpy.size(frame, 0) * scale)), interpolation=cv2.INTER_AREA)
+					if writer is None:
+						writer = cv2.VideoWriter(temp, cv2.VideoWriter_fourcc(*encoder), framerate, (numpy.size(frame, 1), numpy.size(frame, 0)), True)
+					writer.write(frame)
+				index += 1
+				if capture is None:
+					break
+			if isinstance(capture, FrameLogReader):
+				capture.close()
+			elif capture is not None:
+				capture.release()
+		if writer is None:
+			return 0
+		writer.release()
+		writer = None
+		os.rename(temp, target)
+		return os.path.getsize(target)
+	finally:
+		if writer is not None:
+			writer.release()
+		if os.path.isfile(temp):
+			os.remove(temp)
+
+
 # Function: diskinfo
 def diskinfo( file):
 	try:
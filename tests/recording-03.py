@@ -0,0 +1,63 @@
+import os
+import sys
+import time
+import datetime
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from picam import RecordingPlanner
+
+
+# Class: Counter - wraps a filesystem function to count the number of calls
+class Counter:
+	def __init__(self, module, name):
+		self.module = module
+		self.name = name
+		self.function = getattr(module, name)
+		self.calls = 0
+		setattr(module, name, self)
+
+	def __call__(self, *args, **kwargs):
+		self.calls += 1
+		return self.function(*args, **kwargs)
+
+	def restore(self):
+		setattr(self.module, self.name, self.function)
+
+
+# Function: legacypath - image path built as it was done before RecordingPlanner
+def legacypath(location, id):
+	fref = location + time.strftime("/%Y%m/%d/%H", time.localtime())
+	if not os.path.exists(fref):
+		os.makedirs(fref)
+	fref += os.path.sep + "cam" + str(id).rjust(2, '0')
+	fref += "-" + datetime.datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+	fref += ".png"
+	return fref
+
+
+# Function: plannerpath - image path built by RecordingPlanner
+def plannerpath(planner):
+	return planner.getImagePath()
+
+
+# Function: measure
+def measure(label, function, frames):
+	counters = [Counter(os, "stat"), Counter(os, "mkdir")]
+	start = datetime.datetime.now()
+	for index in range(frames):
+		function()
+	duration = (datetime.datetime.now() - start).total_seconds()
+	for counter in counters:
+		counter.restore()
+	calls = sum([counter.calls for counter in counters])
+	print ("\t" + label + ": " + str(round(float(calls) / frames, 3)) + " syscalls/frame, " + str(round(duration * 1000000 / frames, 2)) + " us/frame")
+
+
+print("> Path planning for image recording ..")
+frames = 15 * 60 * 4
+location = tempfile.mkdtemp()
+planner = RecordingPlanner(1, location)
+
+measure("legacy", lambda: legacypath(location, 1), frames)
+measure("planner", lambda: plannerpath(planner), frames)
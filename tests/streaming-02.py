@@ -0,0 +1,72 @@
+import os
+import sys
+import time
+import numpy
+import select
+import socket
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from picam import StreamingServer
+
+
+# Class: Viewers - stream clients read by one thread, so the load test itself does not need a thread per viewer
+class Viewers:
+	def __init__(self, port, count):
+		self.sockets = []
+		self.frames = {}
+		for index in range(count):
+			sock = socket.create_connection(('127.0.0.1', port))
+			sock.sendall("GET /stream HTTP/1.0\r\n\r\n")
+			sock.setblocking(0)
+			self.sockets.append(sock)
+			self.frames[sock.fileno()] = 0
+
+	def read(self, timeout):
+		readable = select.select(self.sockets, [], [], timeout)[0]
+		for sock in readable:
+			try:
+				data = sock.recv(1048576)
+			except socket.error:
+				continue
+			self.frames[sock.fileno()] += data.count("Content-type: image/jpeg")
+
+	def close(self):
+		for sock in self.sockets:
+			sock.close()
+
+
+# Function: frames - synthetic 640x480 frames with noise, so each one is a new JPEG
+def frames(count):
+	random = numpy.random.RandomState(0)
+	return [random.randint(0, 255, (480, 640, 3)).astype(numpy.uint8) for index in range(count)]
+
+
+# Function: measure
+def measure(server, port, viewers, samples, framerate, duration):
+	clients = Viewers(port, viewers)
+	time.sleep(0.5)
+	cpu = os.times()
+	start = time.time()
+	count = 0
+	while time.time() - start < duration:
+		server.setData(samples[count % len(samples)])
+		count += 1
+		deadline = start + float(count) / framerate
+		while time.time() < deadline:
+			clients.read(max(0, deadline - time.time()))
+	clients.read(0.5)
+	used = (os.times()[0] - cpu[0]) + (os.times()[1] - cpu[1])
+	received = sorted(clients.frames.values())
+	clients.close()
+	print ("\t" + str(viewers) + " viewers: " + str(round(used * 1000 / count, 2)) + " ms CPU/frame (encoding, streaming and viewers), " + str(count) + " frames sent, received min/max " + str(received[0]) + "/" + str(received[-1]))
+
+
+print("> MJPEG streaming engine load (one thread for all viewers) ..")
+samples = frames(10)
+server = StreamingServer(('127.0.0.1', 0), sleep=0)
+port = server.server_address[1]
+
+for viewers in [1, 10, 50, 60]:
+	measure(server, port, viewers, samples, 10, 5)
+server.close()
+time.sleep(1)
@@ -0,0 +1,74 @@
+import os
+import sys
+import time
+import numpy
+import socket
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from picam import StreamingServer
+
+
+# Class: Viewer - stream client reading all the frames sent by the server
+class Viewer:
+	def __init__(self, port):
+		self.socket = socket.create_connection(('127.0.0.1', port))
+		self.socket.sendall("GET /stream HTTP/1.0\r\n\r\n")
+		self.socket.setblocking(0)
+
+	def read(self):
+		try:
+			while self.socket.recv(1048576):
+				pass
+		except socket.error:
+			pass
+
+	def close(self):
+		self.socket.close()
+
+
+# Function: snapshot - one snapshot request, as done by a poller
+def snapshot(port):
+	sock = socket.create_connection(('127.0.0.1', port))
+	sock.sendall("GET /snapshot.jpg HTTP/1.0\r\n\r\n")
+	while sock.recv(1048576):
+		pass
+	sock.close()
+
+
+# Function: frames - synthetic 640x480 frames with noise, so each one is a new JPEG
+def frames(count):
+	random = numpy.random.RandomState(0)
+	return [random.randint(0, 255, (480, 640, 3)).astype(numpy.uint8) for index in range(count)]
+
+
+# Function: measure
+def measure(label, server, samples, framerate, duration, viewer=None, polling=None):
+	time.sleep(0.5)
+	cpu = os.times()
+	start = time.time()
+	count = 0
+	while time.time() - start < duration:
+		server.setData(samples[count % len(samples)])
+		count += 1
+		if viewer is not None:
+			viewer.read()
+		if polling is not None and count % int(framerate * polling) == 0:
+			snapshot(server.server_address[1])
+		time.sleep(max(0, start + float(count) / framerate - time.time()))
+	used = (os.times()[0] - cpu[0]) + (os.times()[1] - cpu[1])
+	print ("\t" + label + ": " + str(round(used * 1000 / count, 3)) + " ms CPU/frame, " + str(round(used * 100 / duration, 2)) + "% CPU")
+
+
+print("> MJPEG streaming cost by number of viewers (frames are encoded only when watched) ..")
+samples = frames(10)
+server = StreamingServer(('127.0.0.1', 0), sleep=0)
+port = server.server_address[1]
+
+measure("no viewers", server, samples, 10, 5)
+measure("no viewers, snapshot each second", server, samples, 10, 5, polling=1)
+viewer = Viewer(port)
+measure("one viewer", server, samples, 10, 5, viewer=viewer)
+viewer.close()
+measure("viewer gone", server, samples, 10, 5)
+server.close()
+time.sleep(1)